@@ -0,0 +1,121 @@
+import numpy as np
+from network2d import network
+from grid2d import cellgrid
+
+def solve_cells(look,d,w,north=None):
+    """
+    Weighted least squares east and up velocities of all cells at once.
+    look: LOS unit vectors of shape (ncell, nlos, 3) (east, north, up)
+    d, w: LOS values and weights of shape (ncell, nlos), w=0 for missing values
+    north: north velocity removed from the LOS values (None: north motion neglected)
+    The 2x2 normal equations of the cells are solved in closed form.
+    Return east, up and their standard deviations (NaN for cells observed by less than two LOS
+    or with parallel LOS vectors)
+    """
+    if north is not None:
+        d = d - look[:,:,1]*north
+    ae, au = look[:,:,0], look[:,:,2]
+    n00, n01, n11 = np.sum(w*ae*ae,axis=1), np.sum(w*ae*au,axis=1), np.sum(w*au*au,axis=1)
+    b0, b1 = np.sum(w*ae*d,axis=1), np.sum(w*au*d,axis=1)
+    det = n00*n11 - n01**2
+    ok = (np.count_nonzero(w > 0,axis=1) >= 2) & (det > 1e-6*np.maximum(n00*n11,1e-30))
+    east, up = np.full(len(d),np.nan), np.full(len(d),np.nan)
+    seast, sup = np.full(len(d),np.nan), np.full(len(d),np.nan)
+    east[ok] = (n11[ok]*b0[ok] - n01[ok]*b1[ok])/det[ok]
+    up[ok] = (n00[ok]*b1[ok] - n01[ok]*b0[ok])/det[ok]
+    seast[ok] = np.sqrt(n11[ok]/det[ok])
+    sup[ok] = np.sqrt(n00[ok]/det[ok])
+    return east, up, seast, sup
+
+class decomposition:
+    """
+    decomposition class: east and vertical velocities from two or more InSAR networks
+    (e.g. ascending and descending tracks). LOS and LOS unit vectors of the networks are reduced
+    on a common grid of square cells and the east and up velocities of all cells are solved
+    by weighted least squares with one batched operation. The east and up fields are networks
+    added to insardata.
+    @Param:
+    :reduction: reduction name for plot
+    :networks: list of InSAR networks with LOS unit vectors (lookcol or proj)
+    :cell: cell size (km), default: 1
+    :north: north velocity (same units as the LOS) removed before the decomposition.
+    If None, north motion is neglected, default: None
+    :colors: plot colors of the east and up networks, default: ('darkorange','navy')
+    :lmin,lmax: min max options for plots
+    :samp,perc: samp and perc options of the east and up networks, default: 1, 95
+    Cells are weighted by their number of points, or by 1/sigma**2 if all networks have sigcol:
+    the east and up uncertainties are then propagated in the usig of the networks.
+    """
+
+    def __init__(self,reduction,networks,cell=1.,north=None,colors=('darkorange','navy'),lmin=None,lmax=None,samp=1,perc=95):
+        self.reduction=reduction
+        # networks given as tables of arguments in TOML/YAML files
+        self.networks=[net if isinstance(net,network) else network(**net) for net in networks]
+        self.cell=cell
+        self.north=north
+        self.colors=colors
+        self.lmin=lmin
+        self.lmax=lmax
+        self.samp=samp
+        self.perc=perc
+        self.ref=None
+        self.fields=[]
+
+    def update_proj(self,ref):
+        self.ref = ref
+        for net in self.networks:
+            net.update_proj(ref)
+
+    def field(self,name,color,x,y,u,sig):
+        """ Network of the decomposed field name """
+        first = self.networks[0]
+        net = network(network='{0}_{1}'.format(self.reduction,name),reduction='{0} {1}'.format(self.reduction,name),
+            wdir=first.wdir,dim=1,color=color,samp=self.samp,perc=self.perc,lmin=self.lmin,lmax=self.lmax,
+            utm_proj=first.utm_proj,ref=self.ref)
+        net.update_proj(self.ref)
+        net.x, net.y, net.ulos = x, y, u
+        net.uloscor = net.ulos
+        net.usig = sig
+        net.Npoint = len(u)
+        return net
+
+    def load(self):
+        """ Load the networks and decompose their LOS in east and up fields """
+        for net in self.networks:
+            net.loadinsar()
+        weighted = all(net.usig is not None for net in self.networks)
+        origin = [min(np.nanmin(net.x) for net in self.networks),min(np.nanmin(net.y) for net in self.networks)]
+
+        grids = []
+        for net in self.networks:
+            w = 1./net.usig**2 if weighted else None
+            z = net.ulos
+            if weighted:
+                z = np.where(np.isfinite(w) & (w > 0), z, np.nan)
+            g = cellgrid(net.x,net.y,z,self.cell*1e3,origin=origin,w=w)
+            # mean LOS unit vector of each cell
+            look = np.tile(np.asarray(net.proj,dtype=float),(len(g.index),1)) if net.look is None else net.look[g.index]
+            wp = np.ones(len(g.index)) if w is None else w[g.index]
+            g.look = np.column_stack([np.bincount(g.inv,weights=wp*look[:,c],minlength=len(g))/g.count for c in range(3)])
+            grids.append(g)
+        # common cell numbering of all networks
+        nx = max(np.max(g.ix,initial=0) for g in grids) + 1
+        keys = [g.iy*nx + g.ix for g in grids]
+        cells = np.unique(np.concatenate(keys))
+        ncell, nlos = len(cells), len(grids)
+
+        look = np.zeros((ncell,nlos,3))
+        d, w = np.zeros((ncell,nlos)), np.zeros((ncell,nlos))
+        for i,(g,key) in enumerate(zip(grids,keys)):
+            c = np.searchsorted(cells,key)
+            look[c,i], d[c,i], w[c,i] = g.look, g.median, g.count
+        del grids, keys
+
+        east, up, seast, sup = solve_cells(look,d,w,north=self.north)
+        x = origin[0] + (cells % nx + 0.5)*self.cell*1e3
+        y = origin[1] + (cells // nx + 0.5)*self.cell*1e3
+        ok = np.flatnonzero(~np.isnan(east))
+        print('{0}: east and up velocities of {1} cells over {2} observed cells'.format(self.reduction,len(ok),ncell))
+        self.fields = [
+            self.field('East',self.colors[0],x[ok],y[ok],east[ok],seast[ok] if weighted else None),
+            self.field('Up',self.colors[1],x[ok],y[ok],up[ok],sup[ok] if weighted else None)]
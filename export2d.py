@@ -0,0 +1,161 @@
+import numpy as np
+import json
+import sys
+from os import path
+
+# network and profile attributes saved as metadata
+network_keys = ['network','reduction','wdir','dim','scale','theta','samp','perc','utm_proj','ref','cst','proj','sigcol','lookcol','lookdata','despike','despike_cell']
+profile_keys = ['name','x','y','l','w','strike','typ','flat','lbins','wbins','npbin','maxbin','loc_ramp','utm_proj','ref']
+
+def _meta(obj,keys):
+    """ Return a JSON serialisable dictionary of the obj attributes in keys """
+    meta = {}
+    for key in keys:
+        value = getattr(obj,key,None)
+        if isinstance(value,np.ndarray):
+            value = value.tolist()
+        elif isinstance(value,np.generic):
+            value = value.item()
+        meta[key] = value
+    return meta
+
+class profstore:
+    """
+    profstore class: collect binned profiles, swath points and ramp parameters
+    of a run and write them in a single compressed binary file
+    Parameters:
+    fname: output file name without extension
+    fmt: 'h5' (chunked, gzip compressed HDF5 file, requires h5py) or 'npz' (compressed numpy archive)
+    meta: dictionary of input metadata saved with the file (Optional)
+    """
+
+    def __init__(self,fname,fmt='h5',meta=None):
+        self.fmt=fmt
+        if self.fmt == 'h5':
+            try:
+                import h5py
+            except ImportError:
+                print('h5py is not installed, export profiles in npz format')
+                self.fmt='npz'
+        self.fname=fname+'.'+self.fmt
+        if meta is None:
+            meta = {}
+        self.meta=meta
+        self.entries=[]
+
+    def add(self,profile,insar,res):
+        """
+        Add binned statistics, swath points and ramp parameters of network insar
+        along profile from its profresult res
+        """
+        data = {
+            'distance': np.asarray(res.distance,dtype=np.float64),
+            'moy_los': np.asarray(res.moy_los,dtype=np.float64),
+            'std_los': np.asarray(res.std_los,dtype=np.float64),
+            'err_los': np.asarray(res.err_los,dtype=np.float64),
+            'bins': np.asarray(res.bins,dtype=np.float64),
+            'width': np.asarray(res.width,dtype=np.float64),
+            'xperp': np.asarray(res.xperp,dtype=np.float32),
+            'yperp': np.asarray(res.yperp,dtype=np.float32),
+            'uulos': np.asarray(res.uulos,dtype=np.float32),
+        }
+        if len(res.count) > 0:
+            # exact statistics of the out-of-core bins
+            data['count'] = np.asarray(res.count,dtype=np.int64)
+            data['mean_los'] = np.asarray(res.mean_los,dtype=np.float64)
+            data['std_all'] = np.asarray(res.std_all,dtype=np.float64)
+        ramp = res.ramp if res.ramp is not None else []
+        data['ramp'] = np.asarray(ramp,dtype=np.float64)
+        grid = res.grid
+        if grid is not None:
+            data['grid_along'], data['grid_across'] = grid.along, grid.across
+            data['grid_mean'] = np.asarray(grid.mean,dtype=np.float32)
+            data['grid_std'] = np.asarray(grid.std,dtype=np.float32)
+            data['grid_count'] = np.asarray(grid.count,dtype=np.int64)
+        attrs = {'network': _meta(insar,network_keys), 'profile': _meta(profile,profile_keys)}
+        self.entries.append((profile.name,insar.reduction,data,attrs))
+
+    def write(self):
+        if self.fmt == 'h5':
+            self._write_h5()
+        else:
+            self._write_npz()
+        return self.fname
+
+    def _write_h5(self):
+        import h5py
+        with h5py.File(self.fname,'w') as f:
+            f.attrs['meta'] = json.dumps(self.meta)
+            for name,reduction,data,attrs in self.entries:
+                grp = f.require_group('{}/{}'.format(name,reduction))
+                grp.attrs['meta'] = json.dumps(attrs)
+                for key,value in data.items():
+                    if value.size > 0:
+                        grp.create_dataset(key,data=value,chunks=True,compression='gzip',compression_opts=4,shuffle=True)
+                    else:
+                        grp.create_dataset(key,data=value)
+
+    def _write_npz(self):
+        arrays = {'meta': np.array(json.dumps(self.meta))}
+        for name,reduction,data,attrs in self.entries:
+            key = '{}/{}/'.format(name,reduction)
+            arrays[key+'meta'] = np.array(json.dumps(attrs))
+            for field,value in data.items():
+                arrays[key+field] = value
+        np.savez_compressed(self.fname,**arrays)
+
+def load_profile(fname,name,reduction,fields=None):
+    """
+    Read profile name of network reduction from a file written by profstore.
+    Only the requested fields are read from disk.
+    fields: list of fields among distance, moy_los, std_los, err_los, bins, width, xperp, yperp, uulos, ramp,
+    grid_along, grid_across, grid_mean, grid_std, grid_count for grid profiles
+    and count, mean_los, std_all for out-of-core profiles
+    (Default: all fields)
+    Return a dictionary of arrays and the metadata of the profile under key 'meta'
+    """
+    if not path.exists(fname):
+        print(f"File: {fname} not found, Exit!")
+        sys.exit()
+
+    out = {}
+    if fname.endswith('.h5'):
+        import h5py
+        with h5py.File(fname,'r') as f:
+            grp = f['{}/{}'.format(name,reduction)]
+            if fields is None:
+                fields = list(grp.keys())
+            for field in fields:
+                out[field] = grp[field][()]
+            out['meta'] = json.loads(grp.attrs['meta'])
+    else:
+        # npz members are decompressed on access only
+        with np.load(fname) as f:
+            key = '{}/{}/'.format(name,reduction)
+            if fields is None:
+                fields = [k[len(key):] for k in f.files if k.startswith(key) and k != key+'meta']
+            for field in fields:
+                out[field] = f[key+field]
+            out['meta'] = json.loads(str(f[key+'meta']))
+    return out
+
+def write_map(fname,cols,fmt='npy',chunk=1000000):
+    """
+    Write columns cols (e.g. x, y, los) in fname by chunks of rows.
+    fmt: 'npy' binary float32 file that can be loaded back by network (Default) or
+    'txt' text file
+    chunk: number of rows written at once (Default: 1000000)
+    """
+    n = len(cols[0])
+    if fmt == 'npy':
+        out = np.lib.format.open_memmap(fname,mode='w+',dtype=np.float32,shape=(n,len(cols)))
+        for i in range(0,n,chunk):
+            for j in range(len(cols)):
+                out[i:i+chunk,j] = cols[j][i:i+chunk]
+        out.flush()
+        del out
+    else:
+        with open(fname,'w') as f:
+            for i in range(0,n,chunk):
+                np.savetxt(f,np.column_stack([col[i:i+chunk] for col in cols]),fmt='%.6f')
+    return fname
@@ -0,0 +1,277 @@
+import numpy as np
+
+def group_median(inv,z,ngroup,w=None):
+    """
+    Median of z within groups inv (integer group index of each value between 0 and ngroup-1)
+    computed with a single sort for all groups.
+    If weights w are given, return the weighted median (NaN for empty groups).
+    """
+    order = np.lexsort((z,inv))
+    zs, invs = z[order], inv[order]
+    if w is None:
+        count = np.bincount(inv,minlength=ngroup)
+        start = np.cumsum(count) - count
+        med = np.full(ngroup,np.nan)
+        ok = count > 0
+        lo = start[ok] + (count[ok]-1)//2
+        hi = start[ok] + count[ok]//2
+        med[ok] = 0.5*(zs[lo] + zs[hi])
+        return med
+
+    ws = w[order]
+    cumw = np.cumsum(ws)
+    total = np.bincount(invs,weights=ws,minlength=ngroup)
+    before = np.cumsum(total) - total
+    med = np.full(ngroup,np.nan)
+    ok = total > 0
+    # first value of each group for which the cumulative weight reaches half the group weight
+    idx = np.searchsorted(cumw,before[ok] + 0.5*total[ok])
+    idx = np.minimum(idx,len(zs)-1)
+    med[ok] = zs[idx]
+    return med
+
+class cellgrid:
+    """
+    cellgrid class: reduce scattered points on a regular grid of square cells
+    Parameters:
+    x,y,z: point positions and values (NaN values are ignored)
+    cell: cell size (same units as x,y)
+    origin: [x0,y0] lower-left corner of the grid (Default: minimum of x,y)
+    w: weights of the points (e.g. number of points already averaged in each point) (Optional)
+    Attributes:
+    ix,iy: integer indices of the occupied cells
+    xc,yc: cell centres
+    mean, median, count: statistics of the points within each occupied cell
+    index: indices of the points used (non-NaN)
+    inv: occupied cell of each point in index
+    """
+
+    def __init__(self,x,y,z,cell,origin=None,w=None):
+        self.cell=cell
+        self.index = np.flatnonzero(~np.isnan(z))
+        x, y, z = x[self.index], y[self.index], z[self.index]
+        if w is not None:
+            w = w[self.index]
+        if origin is None:
+            origin = [np.min(x),np.min(y)]
+        self.origin=origin
+
+        ix = np.floor((x-origin[0])/cell).astype(np.int64)
+        iy = np.floor((y-origin[1])/cell).astype(np.int64)
+        nx = np.max(ix) + 1 if len(ix) > 0 else 1
+        cells, self.inv = np.unique(iy*nx + ix, return_inverse=True)
+        self.inv = self.inv.ravel()
+        self.iy, self.ix = cells // nx, cells % nx
+        self.xc = origin[0] + (self.ix + 0.5)*cell
+        self.yc = origin[1] + (self.iy + 0.5)*cell
+
+        ncell = len(cells)
+        if w is None:
+            self.count = np.bincount(self.inv,minlength=ncell).astype(np.float64)
+            self.mean = np.bincount(self.inv,weights=z,minlength=ncell)/self.count
+        else:
+            self.count = np.bincount(self.inv,weights=w,minlength=ncell)
+            self.mean = np.bincount(self.inv,weights=w*z,minlength=ncell)/self.count
+        self.median = group_median(self.inv,z,ncell,w=w)
+
+    def __len__(self):
+        return len(self.xc)
+
+class swathgrid:
+    """
+    swathgrid class: image of the points within a profile swath, binned in distance along
+    and across profile with a single pass over the points
+    Parameters:
+    ypp,xpp,z: along and across profile distances and values of the points (NaN values are ignored)
+    l,w: length and width of the profile
+    dl,dw: bin sizes along and across profile
+    Attributes:
+    along, across: bin centres along and across profile
+    mean, std, count: statistics of the points within each bin, arrays of shape (len(across), len(along))
+    with NaN in empty bins
+    """
+
+    def __init__(self,ypp,xpp,z,l,w,dl,dw):
+        nl, nw = max(int(np.ceil(l/dl)),1), max(int(np.ceil(w/dw)),1)
+        self.along = -l/2. + (np.arange(nl) + 0.5)*dl
+        self.across = -w/2. + (np.arange(nw) + 0.5)*dw
+        self.extent = (-l/2., -l/2. + nl*dl, -w/2., -w/2. + nw*dw)
+
+        ok = ~np.isnan(z) & ~np.isnan(ypp) & ~np.isnan(xpp)
+        il = np.clip(np.floor((ypp[ok] + l/2.)/dl).astype(np.int64),0,nl-1)
+        iw = np.clip(np.floor((xpp[ok] + w/2.)/dw).astype(np.int64),0,nw-1)
+        inv = iw*nl + il
+        # values centred on their mean for an accurate variance
+        z = np.asarray(z[ok],dtype=np.float64)
+        z0 = np.mean(z) if len(z) > 0 else 0.
+        count = np.bincount(inv,minlength=nl*nw).astype(np.float64)
+        s1 = np.bincount(inv,weights=z-z0,minlength=nl*nw)
+        s2 = np.bincount(inv,weights=(z-z0)**2,minlength=nl*nw)
+        with np.errstate(invalid='ignore',divide='ignore'):
+            mean = s1/count
+            var = np.maximum(s2/count - mean**2,0)
+        self.count = count.reshape(nw,nl)
+        self.mean = (mean + z0).reshape(nw,nl)
+        self.std = np.sqrt(var).reshape(nw,nl)
+
+def group_percentile(zs,start,count,q):
+    """
+    Percentile q of sorted values zs within groups of count values starting at start,
+    with the linear interpolation of np.percentile (NaN for empty groups)
+    """
+    out = np.full(len(count),np.nan)
+    ok = count > 0
+    pos = (count[ok]-1)*q/100.
+    lo = np.floor(pos).astype(np.int64)
+    hi = np.minimum(lo+1,count[ok]-1)
+    frac = pos - lo
+    a, b = zs[start[ok]+lo], zs[start[ok]+hi]
+    out[ok] = a + (b-a)*frac
+    return out
+
+def clipped_stats(inv,z,ngroup,perc,w=None,nmin=10):
+    """
+    Statistics of z within groups inv (e.g. bins along profile) for all groups at once.
+    Values outside the percentiles 100-perc and perc of their group are removed and groups
+    with nmin non-NaN values or less are empty.
+    If weights w are given (e.g. 1/sigma**2), medians and standard deviations are weighted.
+    Return keep (mask of the values used), valid (non-empty groups), median, std and err,
+    the standard error of the mean: std/sqrt(n) or 1/sqrt(sum(w)) if weighted
+    """
+    ok = ~np.isnan(z) & (inv >= 0) & (inv < ngroup)
+    if w is not None:
+        ok &= np.isfinite(w) & (w > 0)
+    idx = np.flatnonzero(ok)
+    g, v = inv[idx], np.asarray(z[idx],dtype=np.float64)
+    count = np.bincount(g,minlength=ngroup)
+    start = np.cumsum(count) - count
+    vs = v[np.lexsort((v,g))]
+    lo = group_percentile(vs,start,count,100-perc)
+    hi = group_percentile(vs,start,count,perc)
+    valid = count > nmin
+    kept = (v > lo[g]) & (v < hi[g]) & valid[g]
+    keep = np.zeros(len(z),dtype=bool)
+    keep[idx[kept]] = True
+
+    g, v = g[kept], v[kept]
+    n = np.bincount(g,minlength=ngroup).astype(np.float64)
+    if w is None:
+        wk = np.ones(len(v))
+        median = group_median(g,v,ngroup)
+    else:
+        wk = np.asarray(w[idx][kept],dtype=np.float64)
+        median = group_median(g,v,ngroup,w=wk)
+    with np.errstate(invalid='ignore',divide='ignore'):
+        sw = np.bincount(g,weights=wk,minlength=ngroup)
+        mean = np.bincount(g,weights=wk*v,minlength=ngroup)/sw
+        std = np.sqrt(np.bincount(g,weights=wk*(v-mean[g])**2,minlength=ngroup)/sw)
+        if w is None:
+            err = std/np.sqrt(n)
+        else:
+            err = 1./np.sqrt(sw)
+    return keep, valid, median, std, err
+
+class ramp2d:
+    """
+    ramp2d class: 2D ramp fitted to the differences between two maps in their overlap area.
+    Both maps are reduced on a common grid of square cells and the ramp is fitted to the
+    differences of the cell medians by weighted least squares with a single direct solve.
+    Parameters:
+    x1,y1,z1: positions and values of the reference map
+    x2,y2,z2: positions and values of the map to correct
+    cell: cell size (same units as x,y)
+    order: 'lin' (a + b*x + c*y) or 'quad' (with x**2, x*y and y**2 terms)
+    w1,w2: weights of the points (e.g. 1/sigma**2) (Optional)
+    Attributes:
+    xc,yc: centres of the overlap cells
+    diff: differences z1-z2 of the cell medians
+    weight: weights of the differences, 1/(1/n1+1/n2) with n1,n2 the (weighted) counts of the cells
+    pars: parameters of the ramp in normalised coordinates (None if not enough overlap cells)
+    rms: weighted rms of the residual differences
+    Add ramp(x,y) to z2 to match z1.
+    """
+
+    def __init__(self,x1,y1,z1,x2,y2,z2,cell,order='lin',w1=None,w2=None):
+        self.order = order
+        # points without valid weight are ignored
+        if w1 is not None:
+            z1 = np.where(np.isfinite(w1) & (w1 > 0), z1, np.nan)
+        if w2 is not None:
+            z2 = np.where(np.isfinite(w2) & (w2 > 0), z2, np.nan)
+        origin = [min(np.nanmin(x1),np.nanmin(x2)),min(np.nanmin(y1),np.nanmin(y2))]
+        g1 = cellgrid(x1,y1,z1,cell,origin=origin,w=w1)
+        g2 = cellgrid(x2,y2,z2,cell,origin=origin,w=w2)
+        # common cell numbering for both maps
+        nx = max(np.max(g1.ix,initial=0),np.max(g2.ix,initial=0)) + 1
+        cells, i1, i2 = np.intersect1d(g1.iy*nx + g1.ix, g2.iy*nx + g2.ix, assume_unique=True, return_indices=True)
+        self.xc, self.yc = g1.xc[i1], g1.yc[i1]
+        self.diff = g1.median[i1] - g2.median[i2]
+        self.weight = 1./(1./g1.count[i1] + 1./g2.count[i2])
+
+        # normalised coordinates for a well conditioned quadratic system
+        self.x0 = np.mean(self.xc) if len(cells) > 0 else 0.
+        self.y0 = np.mean(self.yc) if len(cells) > 0 else 0.
+        self.norm = max(np.std(self.xc),np.std(self.yc),cell) if len(cells) > 0 else 1.
+        self.pars = None
+        self.rms = np.nan
+        G = self.basis(self.xc,self.yc)
+        if len(cells) <= G.shape[1]:
+            return
+        Gw = G*self.weight[:,np.newaxis]
+        try:
+            self.pars = np.linalg.solve(np.dot(Gw.T,G),np.dot(Gw.T,self.diff))
+        except np.linalg.LinAlgError:
+            self.pars = None
+            return
+        res = self.diff - np.dot(G,self.pars)
+        self.rms = np.sqrt(np.sum(self.weight*res**2)/np.sum(self.weight))
+
+    def basis(self,x,y):
+        """ Design matrix of the ramp at positions x,y """
+        u, v = (np.asarray(x) - self.x0)/self.norm, (np.asarray(y) - self.y0)/self.norm
+        if self.order == 'quad':
+            return np.column_stack([np.ones(len(u)),u,v,u**2,u*v,v**2])
+        return np.column_stack([np.ones(len(u)),u,v])
+
+    def __call__(self,x,y):
+        """ Ramp at positions x,y (chunked to bound the memory of the design matrix) """
+        out = np.empty(len(x))
+        for i in range(0,len(x),2**20):
+            out[i:i+2**20] = np.dot(self.basis(x[i:i+2**20],y[i:i+2**20]),self.pars)
+        return out
+
+def mad_filter(x,y,z,cell,nmad=5.,nmin=10):
+    """
+    Spatial outliers of z: points deviating from the median of their neighbourhood
+    (cell of the point and its 8 neighbours) by more than nmad times the normalised median
+    absolute deviation (1.4826*MAD) of the neighbourhood. Medians of the neighbourhood are
+    the medians of the cell medians, so that each point is visited by a few sorts only.
+    Neighbourhoods with less than nmin points are not filtered.
+    Return the mask of the outliers (False for NaN values)
+    """
+    out = np.zeros(len(z),dtype=bool)
+    g = cellgrid(x,y,z,cell)
+    ncell = len(g)
+    if ncell == 0:
+        return out
+    # neighbour cells of all cells at once: sorted keys searched for the 9 offsets
+    nx = np.max(g.ix) + 3
+    keys = (g.iy + 1)*nx + (g.ix + 1)
+    order = np.argsort(keys)
+    skeys = keys[order]
+    neigh = np.full((ncell,9),-1,dtype=np.int64)
+    for k,(di,dj) in enumerate([(di,dj) for dj in (-1,0,1) for di in (-1,0,1)]):
+        target = keys + dj*nx + di
+        pos = np.minimum(np.searchsorted(skeys,target),ncell-1)
+        found = skeys[pos] == target
+        neigh[found,k] = order[pos[found]]
+    empty = neigh < 0
+    count = np.sum(np.where(empty,0.,g.count[neigh]),axis=1)
+    ref = np.nanmedian(np.where(empty,np.nan,g.median[neigh]),axis=1)
+
+    dev = np.abs(z[g.index] - ref[g.inv])
+    mad = group_median(g.inv,dev,ncell)
+    mad = np.nanmedian(np.where(empty,np.nan,mad[neigh]),axis=1)
+    bad = (dev > nmad*1.4826*mad[g.inv]) & (count[g.inv] >= nmin) & (mad[g.inv] > 0)
+    out[g.index[bad]] = True
+    return out
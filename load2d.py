@@ -0,0 +1,129 @@
+import os
+import math
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger('plotPro.log')
+
+def _run(func):
+    t0 = time.time()
+    func()
+    return time.time() - t0
+
+def load_datasets(tasks,nworkers=1):
+    """
+    Load datasets with a pool of nworkers threads (file reading, pyproj, pandas and GEOS
+    release the GIL). Return only when all loads are finished.
+    tasks: list of (name, function) to run
+    nworkers: maximum number of concurrent loads. If 1, load sequentially (Default: 1)
+    Return the list of (name, exception) of the failed loads
+    """
+    errors = []
+    ntask = len(tasks)
+    if nworkers <= 1:
+        for i, (name,func) in enumerate(tasks):
+            logger.debug('Load data {0}'.format(name))
+            try:
+                dt = _run(func)
+                logger.info('Loaded {0} ({1}/{2}) in {3:.1f} s'.format(name,i+1,ntask,dt))
+            except (Exception, SystemExit) as e:
+                logger.critical('Failed to load {0}: {1!r}'.format(name,e))
+                errors.append((name,e))
+        return errors
+
+    logger.info('Load {0} datasets with {1} workers'.format(ntask,nworkers))
+    with ThreadPoolExecutor(max_workers=nworkers) as pool:
+        futures = {pool.submit(_run,func): name for name,func in tasks}
+        for i, future in enumerate(as_completed(futures)):
+            name = futures[future]
+            try:
+                dt = future.result()
+                logger.info('Loaded {0} ({1}/{2}) in {3:.1f} s'.format(name,i+1,ntask,dt))
+            except (Exception, SystemExit) as e:
+                logger.critical('Failed to load {0}: {1!r}'.format(name,e))
+                errors.append((name,e))
+    return errors
+
+def count_rows(fname,nsample=10000):
+    """
+    Number of rows of a .npy file or estimate of the number of rows of a text file
+    from the mean length of its first nsample lines
+    """
+    if fname.endswith('.npy'):
+        import numpy as np
+        return np.load(fname,mmap_mode='r').shape[0]
+    nbyte, nline = 0, 0
+    with open(fname,'rb') as f:
+        for line in f:
+            nbyte += len(line)
+            if not line.lstrip().startswith(b'#'):
+                nline += 1
+            if nline >= nsample:
+                break
+    if nline == 0:
+        return 0
+    return int(os.path.getsize(fname)*nline/float(nbyte))
+
+def row_bytes(insar):
+    """
+    Bytes per row of an InSAR network: columns parsed (read) and arrays kept in memory
+    for map and profiles (kept)
+    """
+    ncols = 3 + (insar.theta is True) + (insar.sigcol is not None) + 3*(insar.lookcol is not None)
+    # coordinates, LOS and corrected LOS, swath indices and profile coordinates
+    kept = 8*4 + 24
+    if insar.utm_proj is not None:
+        kept += 8
+    if insar.theta is True:
+        kept += 4
+    if insar.sigcol is not None:
+        kept += 4
+    if insar.lookcol is not None:
+        kept += 12
+    return 8*ncols, kept
+
+def plan_memory(insar,fname,budget,nostream=None):
+    """
+    Choose the subsampling (samp) and the out-of-core chunk size (chunksize) of network insar
+    so that its expected peak memory stays within budget (bytes). Profiles are streamed by chunks
+    at full resolution when possible, otherwise the network is subsampled.
+    nostream: reason why the profiles of the network need its swath points and cannot be
+    streamed (e.g. flattening), None if they can
+    Return the expected peak memory (bytes)
+    """
+    nrows = count_rows(fname)
+    read, kept = row_bytes(insar)
+    peak = nrows*(read + kept)
+    if peak <= budget:
+        logger.info('Memory budget: {0} ({1} rows) fits in {2:.2f} GB, expected peak {3:.2f} GB'.format(
+            insar.network,nrows,budget/2.**30,peak/2.**30))
+        return peak
+
+    # options that are not used in out-of-core mode
+    for key in ['theta','sigcol','lookcol','despike','grid']:
+        if (nostream is None) and getattr(insar,key) not in [None,False]:
+            nostream = '{0} option'.format(key)
+    if nostream is None:
+        # half of the budget for the chunks, half for the subsampled map
+        insar.chunksize = max(int(budget/2./(read + kept)),10000)
+        insar.samp = max(insar.samp,int(math.ceil(nrows*24./(budget/2.))))
+        peak = insar.chunksize*(read + kept) + nrows/insar.samp*24.
+        logger.info('Memory budget: {0} ({1} rows) read by chunks of {2} rows, map subsampled every {3} rows, expected peak {4:.2f} GB'.format(
+            insar.network,nrows,insar.chunksize,insar.samp,peak/2.**30))
+        return peak
+
+    if fname.endswith('.npy'):
+        # rows are read from the memory map
+        insar.samp = max(insar.samp,int(math.ceil(nrows*(read + kept)/float(budget))))
+        peak = nrows/insar.samp*(read + kept)
+    else:
+        # all rows are parsed before subsampling
+        insar.samp = max(insar.samp,int(math.ceil(nrows*kept/float(budget))))
+        peak = nrows*read + nrows/insar.samp*kept
+    logger.info('Memory budget: {0} ({1} rows) subsampled every {2} rows ({3} needs the swath points), expected peak {4:.2f} GB'.format(
+        insar.network,nrows,insar.samp,nostream,peak/2.**30))
+    if peak > budget:
+        logger.warning('Memory budget: parsing {0} needs {1:.2f} GB, convert it to .npy to stay within the budget'.format(
+            insar.network,nrows*read/2.**30))
+    return peak
@@ -1,22 +1,55 @@
 import numpy as np
 import math
-import pyproj
 import sys
-import pandas
+from readtxt import loadcols
+
+def screw(x,D,s=1.):
+    """ Fault-parallel surface velocity at distance x of a screw dislocation slipping at rate s below locking depth D """
+    return s/np.pi*np.arctan(x/D)
+
+def edge(x,D,dip,s=1.,dipdir=1):
+    """
+    Horizontal and vertical surface velocities at distance x from the fault trace of a dip-slip
+    edge dislocation slipping at rate s below locking depth D. The tip of the dislocation lies
+    D/tan(dip) from the trace in the dip direction: dipdir=1 towards positive x, -1 towards negative x
+    """
+    d = np.deg2rad(dip)
+    # distance from the point above the tip of the dislocation
+    z = (dipdir*x - D/np.tan(d))/D
+    ux = s/np.pi*(np.cos(d)*np.arctan(z) + (np.sin(d) - z*np.cos(d))/(1 + z**2))
+    uz = -s/np.pi*(np.sin(d)*np.arctan(z) + (np.cos(d) + z*np.sin(d))/(1 + z**2))
+    return dipdir*ux, uz
 
 class fault2d:
     """ 
-    fault2d class: Load 2D fault for plot only
-    help to position fault for futher modeling
+    fault2d class: Load 2D fault for plot and interseismic models
     Parameters: 
     name: name fault
     x,y: position east, north
     utm_proj: EPSG UTM projection. If not None, project data from WGS84 to EPSG.
     ref: [lon, lat] reference point. Translate all data to this point (default: None)
+    model: forward model fitted on the profiles (default: None, plot only)
+           * screw - strike-slip screw dislocation, fitted on LOS or fault-parallel GNSS
+           * dipslip - dip-slip edge dislocation, fitted on LOS (horizontal and vertical rates)
+             or fault-perpendicular GNSS
+    dip: dip of the dip-slip dislocation in degrees (default: 90)
+    dipdir: dip direction of the dip-slip dislocation along profiles: 1 towards positive distances, -1 towards negative distances (default: 1)
+    depths: candidate locking depths in km (default: 1 to 30 km every km)
+    fit: data fitted by the model: insar (first InSAR profile) or gps (first GNSS network) (default: insar)
+    color: color of the fault and model curves (default: red)
     """
 
-    def __init__(self,name,x,y,lon=None, lat=None, strike=None,utm_proj=None, ref=None):
+    def __init__(self,name,x,y,lon=None, lat=None, strike=None,utm_proj=None, ref=None,
+        model=None,dip=90.,dipdir=1,depths=None,fit='insar',color='red'):
         self.name=name
+        self.model=model
+        self.dip=dip
+        self.dipdir=dipdir
+        if depths is None:
+            depths = np.arange(1.,31.)
+        self.depths=np.asarray(depths,dtype=np.float64)*1e3
+        self.fit=fit
+        self.color=color
         if (x is None) or (y is None):
            print('utm_proj is not defined, you must defined position (x,y) in UTM. Exit!')
            sys.exit()
@@ -38,6 +71,7 @@ class fault2d:
     def update_proj(self,ref):
         self.ref=ref 
         if self.utm_proj is not None:
+            import pyproj
             self.UTM = pyproj.Proj("EPSG:{}".format(self.utm_proj))
             if self.ref is not None:
                 self.ref_x,self.ref_y =  self.UTM(self.ref[0],self.ref[1])
@@ -49,8 +83,66 @@ class fault2d:
             self.x,self.y = (self.xx-self.ref_x)*1e3,(self.yy - self.ref_y)*1e3 
         else:
             print('Read reference point profile in lat/lon')
-            x, y = self.UTM(self.lon, self.lat) 
-            self.x,self.y= (x-self.ref_x), (y-self.ref_y)
+            if self.lat is not None:
+                x, y = self.UTM(self.lon, self.lat) 
+                self.x,self.y= (x-self.ref_x), (y-self.ref_y)
+
+    def basis(self,x,D,los=True):
+        """
+        Model functions of unit slip at distances x from the fault and locking depths D.
+        Return a list of arrays, one per rate: screw, horizontal and vertical dip-slip (LOS)
+        or horizontal dip-slip (GNSS)
+        """
+        if self.model == 'screw':
+            return [screw(x,D)]
+        ux, uz = edge(x,D,self.dip,dipdir=self.dipdir)
+        if los:
+            return [ux, uz]
+        return [ux]
+
+    def invert(self,xs,ds,sigmas=None,los=True):
+        """
+        Grid search of the locking depth and linear inversion of the slip rates and offset
+        for all candidate depths and all profiles at once. Profiles are padded to the same
+        number of points with zero weights.
+        xs, ds, sigmas: lists of distances to the fault (m), data and uncertainties, one per profile
+        los: if True data are LOS, else GNSS
+        Set depth, pars (rates and offset) and rms for each profile and the misfit grid (depths x profiles)
+        """
+        nprof = len(xs)
+        n = max([len(x) for x in xs] + [1])
+        X, d, W = np.zeros((nprof,n)), np.zeros((nprof,n)), np.zeros((nprof,n))
+        for k in range(nprof):
+            x, dk = np.asarray(xs[k],dtype=np.float64), np.asarray(ds[k],dtype=np.float64)
+            wk = np.ones(len(x)) if sigmas is None else 1./np.asarray(sigmas[k],dtype=np.float64)
+            ok = ~np.isnan(x) & ~np.isnan(dk) & np.isfinite(wk)
+            X[k,:len(x)][ok], d[k,:len(x)][ok], W[k,:len(x)][ok] = x[ok], dk[ok], wk[ok]
+
+        # G: depths x profiles x points x parameters
+        D = self.depths[:,None,None]
+        funcs = self.basis(X[None,:,:],D,los=los)
+        G = np.stack(funcs + [np.ones(funcs[0].shape)],axis=-1)*W[None,:,:,None]
+        dw = d*W
+        npar = G.shape[-1]
+        GtG = np.einsum('dpni,dpnj->dpij',G,G) + 1e-12*np.eye(npar)
+        Gtd = np.einsum('dpni,pn->dpi',G,dw)
+        m = np.linalg.solve(GtG,Gtd[...,None])[...,0]
+        res = dw[None] - np.einsum('dpni,dpi->dpn',G,m)
+        count = np.sum(W > 0,axis=1)
+        self.misfit = np.sum(res**2,axis=-1)/np.maximum(count,1)
+        self.misfit[:,count <= npar] = np.nan
+
+        best = np.argmin(np.where(np.isnan(self.misfit),np.inf,self.misfit),axis=0)
+        self.depth = np.where(count > npar,self.depths[best],np.nan)
+        self.pars = m[best,np.arange(nprof)]
+        self.rms = np.sqrt(self.misfit[best,np.arange(nprof)])
+        self.los = los
+        return self.depth, self.pars
+
+    def forward(self,x,k):
+        """ Model of profile k at distances x from the fault (m) """
+        funcs = self.basis(np.asarray(x,dtype=np.float64),self.depth[k],los=self.los)
+        return sum(p*f for p,f in zip(self.pars[k][:-1],funcs)) + self.pars[k][-1]
 
 class profile:
     """ 
@@ -67,13 +159,18 @@ class profile:
            * std - plot mean and standard deviation InSAR 
            * distscale - scatter plot with color scale function of the profile-parallel distance;
            * stdscat - plot scatter + standar deviation. 
+           * grid - image of the mean InSAR within bins along and across profile
+           * density - log-scaled grey density image of the InSAR points with median and standard deviation in the network color
     flat: if not None, estimate a ramp along profile. lin: linear ramp, quad: quadratic, cub: cubic. If number InSAR network is 2 then estimate ramp within the overlaping area (Default: None)
     lbins: larger bins for profile (Default: None)
+    wbins: size of the bins across profile for grid type (Default: None, w/20)
+    npbin: if not None, adaptive bins of npbin points along profile for each dataset instead of lbins (Default: None)
+    maxbin: maximum width of the adaptive bins in km: sparse segments are split in bins of maxbin (Default: None)
     loc_ramp: location ramp estimation. Can be positive (for postive distances along profile) or negative. (Default: None)
     """
 
     def __init__(self,name,l,w,strike,type=None,
-        flat=None,lbins=None,loc_ramp=None,x=None,y=None,lat=None,lon=None,utm_proj=None, ref=None):
+        flat=None,lbins=None,wbins=None,npbin=None,maxbin=None,loc_ramp=None,x=None,y=None,lat=None,lon=None,utm_proj=None, ref=None):
         self.name=name
         self.x, self.xx = x, x
         self.y, self.yy = y, y
@@ -84,6 +181,15 @@ class profile:
             self.lbins=lbins*1e3
         else:
             self.lbins=lbins
+        if wbins is not None:
+            self.wbins=wbins*1e3
+        else:
+            self.wbins=self.w/20.
+        self.npbin=npbin
+        if maxbin is not None:
+            self.maxbin=maxbin*1e3
+        else:
+            self.maxbin=maxbin
         self.loc_ramp=loc_ramp
 
         if (x is None) and (lat is None):
@@ -98,6 +204,11 @@ class profile:
         else:
             self.strike=strike
 
+        # profile azimuth
+        self.str=(self.strike*math.pi)/180
+        self.s=[math.sin(self.str),math.cos(self.str),0]
+        self.n=[math.cos(self.str),-math.sin(self.str),0]
+
         self.typ=type
         # lmin,lmax needs to be an attribute of network because different plots for both
 
@@ -110,6 +221,7 @@ class profile:
     def update_proj(self,ref):
         self.ref=ref
         if self.utm_proj is not None:
+            import pyproj
             try:
                 crs = pyproj.CRS.from_epsg(self.utm_proj)
                 self.UTM = pyproj.Proj(crs, always_xy=True)
@@ -129,6 +241,38 @@ class profile:
                 x, y = self.UTM(self.lon, self.lat) 
                 self.x,self.y=(x-self.ref_x),(y-self.ref_y)
 
+    def bins(self,nb=None):
+        """
+        Return bin edges along profile every nb (Default: lbins) and the distance
+        associated to each bin
+        """
+        if nb is None:
+            nb = self.lbins
+        bins = np.arange(-self.l/2-1,self.l/2+1,nb)
+        return bins, bins[:-1] + (bins[1:] - bins[:-1])/2.
+
+    def count_bins(self,ypp):
+        """
+        Adaptive bin edges along profile with npbin points of distances ypp per bin,
+        from a single sort. Bins wider than maxbin are split in equal bins narrower than maxbin.
+        Bin j contains the points between edges j and j+1.
+        Return bin edges and the distance associated to each bin
+        """
+        ys = np.sort(ypp[~np.isnan(ypp)])
+        if len(ys) < 2:
+            return np.array([-self.l/2.,self.l/2.]), np.array([0.])
+        # edges halfway between the last point of a bin and the first point of the next one
+        i = np.arange(self.npbin,len(ys),self.npbin)
+        bins = np.concatenate([[ys[0]-1.],(ys[i-1] + ys[i])/2.,[ys[-1]+1.]])
+        if self.maxbin is not None:
+            width = np.diff(bins)
+            nsplit = np.maximum(np.ceil(width/self.maxbin).astype(np.int64),1)
+            start = np.repeat(bins[:-1],nsplit)
+            step = np.repeat(width/nsplit,nsplit)
+            sub = np.arange(len(start)) - np.repeat(np.cumsum(nsplit) - nsplit,nsplit)
+            bins = np.concatenate([start + sub*step,[bins[-1]]])
+        return bins, bins[:-1] + (bins[1:] - bins[:-1])/2.
+
 class topo:
     """ 
     topo class: Load topographic file 
@@ -168,6 +312,7 @@ class topo:
     def update_proj(self,ref):
         self.ref = ref
         if self.utm_proj is not None:
+            import pyproj
             try:
                 crs = pyproj.CRS.from_epsg(self.utm_proj)
                 self.UTM = pyproj.Proj(crs, always_xy=True)
@@ -183,11 +328,11 @@ class topo:
         self.update_proj(self.ref)
         fname=self.wdir+self.filename
         if self.utm_proj is None:
-            x,y,z=np.loadtxt(fname,comments='#',unpack=True,dtype='f,f,f')
+            x,y,z=loadcols(fname,(0,1,2),dtype='f',comments='#')
             # convert to meter
             self.x,self.y,self.z = (x-self.ref_x)*1e3,(y-self.ref_y)*1e3,z*self.scale
         else:
-            self.lon,self.lat,z=np.loadtxt(fname,comments='#',unpack=True,dtype='f,f,f')
+            self.lon,self.lat,z=loadcols(fname,(0,1,2),dtype='f',comments='#')
             x, y = self.UTM(self.lon, self.lat) 
             self.x,self.y,self.z=(x-self.ref_x),(y-self.ref_y),z*self.scale
         
@@ -217,6 +362,13 @@ class shapefile:
         self.linewidth=linewidth
         self.crs=utm_proj
         self.ref=ref
+        self.shape=None
+
+    def load(self):
+        import geopandas as gpd
+        self.shape = gpd.read_file(self.wdir + self.filename)
+        if self.crs != None:
+            self.shape = self.shape.to_crs("EPSG:{}".format(self.crs))
 
 class seismicity:
     """
@@ -231,9 +383,12 @@ class seismicity:
     Column attributes: time,latitude,longitude,depth,mag,magType,nst,gap,dmin,rms,net,id,updated,place,type,horizontalError,depthError,magError,magNst,status,locationSource,magSource
     if fmt = 'txt':
     Column attributes: date,mag,latitude,longitude,depth
+    density: if not None, draw the catalog as log-scaled density images of density x density pixels
+    in map view and depth sections instead of one marker per event (default: None)
+    maglarge: events of magnitude larger than maglarge are drawn individually in density mode (default: None)
     """    
     
-    def __init__(self,name,wdir,filename,color='black',width=2.,utm_proj=None,ref=None,fmt='csv'):
+    def __init__(self,name,wdir,filename,color='black',width=2.,utm_proj=None,ref=None,fmt='csv',density=None,maglarge=None):
         self.name=name
         self.filename=filename
         self.wdir=wdir
@@ -243,10 +398,13 @@ class seismicity:
         self.ref=ref
         self.fmt = fmt
         self.ref_x,self.ref_y = 0,0
+        self.density = density
+        self.maglarge = maglarge
 
     def update_proj(self,ref):
         self.ref = ref
         if self.utm_proj is not None:
+            import pyproj
             try:
                 crs = pyproj.CRS.from_epsg(self.utm_proj)
                 self.UTM = pyproj.Proj(crs, always_xy=True)
@@ -262,6 +420,7 @@ class seismicity:
         self.update_proj(self.ref)
         fname=self.wdir+self.filename
         if self.fmt == 'csv':
+          import pandas
           df = pandas.read_csv(fname)
           lat,lon,depth,mag=df['latitude'][:].to_numpy(),df['longitude'][:].to_numpy(),df['depth'][:].to_numpy(),df['mag'][:].to_numpy() 
           if self.utm_proj is None:
@@ -270,12 +429,15 @@ class seismicity:
             x, y = self.UTM(lon, lat)
             self.x,self.y,self.z,self.mag=(x-self.ref_x),(y-self.ref_y),depth,mag
         elif  self.fmt == 'txt':
-          date,self.mag,y,x,depth = np.loadtxt(fname,comments = '#',unpack = True,dtype = 'S,f,f,f,f')
+          self.mag,y,x,depth = loadcols(fname,(1,2,3,4),dtype='f',comments='#')
           if self.utm_proj is not None:
              x, y = self.UTM(x, y)
              self.x, self.y = (x - self.ref_x), (y - self.ref_y)
           else:
              self.x, self.y = (x-self.ref_x)*1e3, (y-self.ref_y)*1e3 
+        # depths in meters
         if np.nanmean(abs(depth)) < 100:
             self.depth = depth*1000
+        else:
+            self.depth = depth
            
@@ -2,6 +2,22 @@ import numpy as np
 import math
 import sys
 from os import path
+from grid2d import cellgrid, mad_filter
+from readtxt import loadcols, itercols
+from stream2d import binstats
+from swath2d import frame, inswath, swaths
+
+def _lattice(u):
+    """ Origin, step and integer indices of coordinates u on a regular lattice, or None """
+    uu = np.unique(u)
+    if len(uu) < 2:
+        return None
+    step = np.median(np.diff(uu))
+    pos = (u - uu[0])/step
+    idx = np.rint(pos)
+    if np.max(np.abs(pos - idx)) > 0.1:
+        return None
+    return uu[0], step, idx.astype(np.int64)
 
 class network:
     """ 
@@ -21,10 +37,31 @@ class network:
     :utm_proj: EPSG UTM projection. If not None, project data from WGS84 to EPSG.
     :ref: [lon, lat] reference point. Translate all data to this point (default: None). 
     :prof=[east, north, up] optional projection into average LOS vector
+    :npoints: target number of points for map view, GNSS co-location and quick-look profiles.
+    If not None, build a multi-resolution pyramid of the LOS map with mean/median/count per cell
+    and use the finest level with less than npoints cells, default: None
+    :chunksize: if not None, out-of-core mode: read the input file by chunks of chunksize rows and
+    accumulate profile statistics with bounded memory. Only every samp rows are kept in memory
+    for map view, default: None
+    :grid: True if the points lie on a regular grid of the input coordinates (e.g. raster
+    converted to x y los rows), 'auto' to detect it. Grid networks are stored as a 2D array
+    of point indices with a geotransform: swaths are extracted within the bounding window
+    of each profile and maps are drawn as images, default: False
+    :sigcol: column of the per-pixel LOS uncertainty in the InSAR file. If not None, bins are
+    weighted by 1/sigma**2 and standard errors are used in ramp fitting, default: None
+    :lookcol: columns (east, north, up) of the per-pixel LOS unit vector in the InSAR file, used
+    by decomposition and to project GNSS into LOS. If None, proj is used for all pixels, default: None
+    :lookdata: reduction of the InSAR network with per-pixel LOS unit vectors (lookcol) used to
+    project GNSS into LOS at each station instead of proj, default: None
+    :despike: if not None, remove spatial outliers (e.g. unwrapping errors) after loading: pixels
+    deviating from the median of their neighbourhood by more than despike times the normalised MAD
+    are set to NaN, default: None
+    :despike_cell: cell size of the neighbourhoods (km, 3x3 cells around each pixel), default: 1
     """
 
     def __init__(self,network,reduction,wdir,dim,color='black',scale=1.,theta=False,\
-        samp=1,perc=95,lmin=None,lmax=None,plotName=None, utm_proj=None, ref=None, cst=0, proj=None):
+        samp=1,perc=95,lmin=None,lmax=None,plotName=None, utm_proj=None, ref=None, cst=0, proj=None, npoints=None, chunksize=None, sigcol=None, grid=False,\
+        lookcol=None, lookdata=None, despike=None, despike_cell=1.):
 
         self.network=network
         self.reduction=reduction
@@ -58,6 +95,37 @@ class network:
 
         # projection to LOS
         self.proj = proj
+        self.projected = False
+
+        # multi-resolution pyramid
+        self.npoints = npoints
+        self.pyramid = None
+
+        # per-pixel LOS uncertainties
+        self.sigcol = sigcol
+        self.usig = None
+
+        # per-pixel LOS unit vectors (N x 3)
+        self.lookcol = lookcol
+        self.look = None
+        self.lookdata = lookdata
+
+        # out-of-core profile statistics
+        self.chunksize = chunksize
+        self.stats = None
+
+        # swath points of each profile extracted by tile workers
+        self.swath = None
+
+        # regular grid: geotransform (u0, du, v0, dv) of the input coordinates and
+        # 2D array of the point indices (-1 for empty cells)
+        self.grid = grid
+        self.gt = None
+        self.cells = None
+
+        # spatial outlier filter
+        self.despike = despike
+        self.despike_cell = despike_cell
 
     def update_proj(self,ref):
        self.ref = ref
@@ -93,13 +161,13 @@ class network:
 
         if self.dim == 2:
             if self.utm_proj is None:
-                self.x, self.y, east, north, esigma, nsigma, self.name = np.loadtxt(
-                    gpsf, comments='#', unpack=True, dtype='f,f,f,f,f,f,S4', usecols=(0, 1, 2, 3, 4, 5, 6))
+                self.x, self.y, east, north, esigma, nsigma, self.name = loadcols(
+                    gpsf, (0, 1, 2, 3, 4, 5, 6), dtype=['f', 'f', 'f', 'f', 'f', 'f', 'S4'], comments='#')
                 # Convert to meters
                 self.x, self.y = self.x * 1e3, self.y * 1e3
             else:
-                self.lon, self.lat, east, north, esigma, nsigma, self.name = np.loadtxt(
-                    gpsf, comments='#', unpack=True, dtype='f,f,f,f,f,f,S4', usecols=(0, 1, 2, 3, 4, 5, 6))
+                self.lon, self.lat, east, north, esigma, nsigma, self.name = loadcols(
+                    gpsf, (0, 1, 2, 3, 4, 5, 6), dtype=['f', 'f', 'f', 'f', 'f', 'f', 'S4'], comments='#')
                 self.x, self.y = self.UTM(self.lon, self.lat)
                 self.x, self.y = (self.x - self.ref_x), (self.y - self.ref_y)
 
@@ -111,13 +179,13 @@ class network:
 
         elif self.dim == 3:
             if self.utm_proj is None:
-                self.x, self.y, east, north, up, esigma, nsigma, upsigma, self.name = np.loadtxt(
-                    gpsf, comments='#', unpack=True, usecols=(0, 1, 2, 3, 4, 5, 6, 7, 8), dtype='f,f,f,f,f,f,f,f,S4')
+                self.x, self.y, east, north, up, esigma, nsigma, upsigma, self.name = loadcols(
+                    gpsf, (0, 1, 2, 3, 4, 5, 6, 7, 8), dtype=['f', 'f', 'f', 'f', 'f', 'f', 'f', 'f', 'S4'], comments='#')
                 # Convert to meters
                 self.x, self.y = self.x * 1e3, self.y * 1e3
             else:
-                self.lon, self.lat, east, north, up, esigma, nsigma, upsigma, self.name = np.loadtxt(
-                    gpsf, comments='#', unpack=True, usecols=(0, 1, 2, 3, 4, 5, 6, 7, 8), dtype='f,f,f,f,f,f,f,f,S4')
+                self.lon, self.lat, east, north, up, esigma, nsigma, upsigma, self.name = loadcols(
+                    gpsf, (0, 1, 2, 3, 4, 5, 6, 7, 8), dtype=['f', 'f', 'f', 'f', 'f', 'f', 'f', 'f', 'S4'], comments='#')
                 self.x, self.y = self.UTM(self.lon, self.lat)
                 self.x, self.y = (self.x - self.ref_x), (self.y - self.ref_y)
 
@@ -132,8 +200,7 @@ class network:
         self.Npoint = len(self.name)
 
         if self.proj is not None:
-            self.ulos = self.ux * self.proj[0] + self.uy * self.proj[1] + self.uv * self.proj[2]
-            self.sigmalos = self.sigmax * self.proj[0] + self.sigmay * self.proj[1] + self.sigmav * self.proj[2]
+            self.project_los(np.asarray(self.proj, dtype=float))
         else:
             self.ulos, self.sigmalos = np.zeros((self.Npoint)), np.zeros((self.Npoint))
 
@@ -141,35 +208,88 @@ class network:
              self.lmin = np.min(np.array([self.ux,self.uy])) - 1
              self.lmax = np.max(np.array([self.ux,self.uy])) + 1
 
+    def project_los(self,look):
+        """
+        Project GNSS velocities into LOS with the LOS unit vector look: [east, north, up] for all
+        stations or array of shape (Npoint, 3). Uncertainties are propagated assuming independent
+        components: sigmalos = sqrt(sum((sigma*look)**2)). Set projected to True
+        """
+        look = np.atleast_2d(look)
+        if self.dim == 3:
+            uv, sigmav = self.uv, self.sigmav
+        else:
+            uv, sigmav = np.zeros(self.Npoint), np.zeros(self.Npoint)
+        self.ulos = self.ux * look[:,0] + self.uy * look[:,1] + uv * look[:,2]
+        self.sigmalos = np.sqrt((self.sigmax * look[:,0])**2 + (self.sigmay * look[:,1])**2 + (sigmav * look[:,2])**2)
+        self.projected = True
+
+    def interp_look(self,insar,nn=4):
+        """
+        LOS unit vectors of the stations interpolated from the per-pixel LOS unit vectors of
+        network insar (lookcol): inverse distance weighting of the nn nearest pixels found for all
+        stations with one query of a k-d tree. Return an array of shape (Npoint, 3)
+        """
+        from scipy.spatial import cKDTree
+        ok = np.flatnonzero(np.all(np.isfinite(insar.look), axis=1) & ~np.isnan(insar.x) & ~np.isnan(insar.y))
+        nn = min(nn, len(ok))
+        tree = cKDTree(np.column_stack([insar.x[ok], insar.y[ok]]))
+        dist, idx = tree.query(np.column_stack([self.x, self.y]), k=nn)
+        dist, idx = dist.reshape(self.Npoint, nn), idx.reshape(self.Npoint, nn)
+        w = 1./np.maximum(dist, 1e-6)
+        look = np.einsum('ij,ijk->ik', w, insar.look[ok[idx]]) / np.sum(w, axis=1)[:, np.newaxis]
+        # unit vectors
+        return look / np.linalg.norm(look, axis=1)[:, np.newaxis]
+
+    def readcols(self,fname,usecols):
+        """
+        Read columns usecols of a text file or of a binary .npy file (e.g. flattened map)
+        and subsample them every samp rows
+        """
+        if fname.endswith('.npy'):
+            data = np.load(fname, mmap_mode='r')
+            return [np.array(data[::self.samp, col], dtype=np.float32) for col in usecols]
+        cols = loadcols(fname, usecols, dtype=np.float32, comments='#')
+        return [col[::self.samp] for col in cols]
+
     def loadinsar(self):
+        """
+        Load InSAR text file in the form:
+            x   y   los   (incidence if theta is True)
+        or binary .npy file with the same columns. The LOS uncertainty is read in
+        column sigcol and the LOS unit vector in columns lookcol if defined
+        """
         self.update_proj(self.ref)
         insarf = self.wdir + '/' + self.network
         if not path.exists(insarf):
             print(f"File: {insarf} not found, Exit!")
             sys.exit()
 
+        if not self.theta:
+            usecols = (0, 1, 2)
+        else:
+            usecols = (0, 1, 2, 3)
+        if self.sigcol is not None:
+            usecols = usecols + (self.sigcol,)
+        if self.lookcol is not None:
+            usecols = usecols + tuple(self.lookcol)
+        cols = self.readcols(insarf, usecols)
+        if self.lookcol is not None:
+            self.look = np.column_stack(cols[-3:])
+            del cols[-3:]
+        if self.sigcol is not None:
+            self.usig = cols.pop() * abs(self.scale)
+
         if self.utm_proj is None:
             if not self.theta:
-                self.x, self.y, ulos = np.loadtxt(insarf, comments='#', unpack=True, usecols=(0, 1, 2),
-                                                  dtype=np.float32)
-                # Convert to meters and apply sampling
-                self.x, self.y, ulos = self.x[::self.samp] * 1e3, self.y[::self.samp] * 1e3, ulos[::self.samp]
+                # Convert to meters
+                self.x, self.y, ulos = cols[0] * 1e3, cols[1] * 1e3, cols[2]
             else:
-                self.x, self.y, ulos, self.los = np.loadtxt(insarf, comments='#', unpack=True, usecols=(0, 1, 2, 3),
-                                                            dtype=np.float32)
-                self.x, self.y, ulos, self.los = self.x[::self.samp], self.y[::self.samp], ulos[::self.samp], self.los[
-                                                                                                              ::self.samp]
+                self.x, self.y, ulos, self.los = cols
         else:
             if not self.theta:
-                self.lon, self.lat, ulos = np.loadtxt(insarf, comments='#', unpack=True, usecols=(0, 1, 2),
-                                                      dtype=np.float32)
-                self.lon, self.lat, ulos = self.lon[::self.samp], self.lat[::self.samp], ulos[::self.samp]
+                self.lon, self.lat, ulos = cols
             else:
-                self.lon, self.lat, ulos, self.los = np.loadtxt(insarf, comments='#', unpack=True, usecols=(0, 1, 2, 3),
-                                                                dtype=np.float32)
-                self.lon, self.lat, ulos, self.los = self.lon[::self.samp], self.lat[::self.samp], ulos[
-                                                                                                   ::self.samp], self.los[
-                                                                                                                 ::self.samp]
+                self.lon, self.lat, ulos, self.los = cols
 
             # Convert lon/lat to UTM and adjust with the reference point
             self.x, self.y = self.UTM(self.lon, self.lat)
@@ -178,4 +298,289 @@ class network:
         # Apply scale and constant to ulos
         self.ulos = ulos * self.scale + self.cst
         self.Npoint = len(self.ulos)
-    
+
+        if self.despike is not None:
+            self.remove_outliers()
+
+        if self.grid:
+            self.build_grid(cols[0], cols[1])
+
+        if self.npoints is not None:
+            self.build_pyramid()
+
+    def remove_outliers(self):
+        """ Set the spatial outliers of the LOS to NaN (despike option) """
+        bad = mad_filter(self.x, self.y, self.ulos, self.despike_cell*1e3, nmad=self.despike)
+        nbad = np.count_nonzero(bad)
+        self.ulos[bad] = np.nan
+        print('{0}: {1} outliers removed over {2} points ({3:.2f}%)'.format(self.network, nbad, self.Npoint,
+            100.*nbad/max(self.Npoint,1)))
+
+    def build_grid(self,u,v):
+        """
+        Store the points as a 2D array of point indices if the input coordinates u,v
+        lie on a regular grid (grid option)
+        """
+        lu, lv = None, None
+        if len(u) > 1 and not (np.any(np.isnan(u)) or np.any(np.isnan(v))):
+            lu, lv = _lattice(u), _lattice(v)
+        if (lu is None) or (lv is None) or (max(lu[2]) + 1)*(max(lv[2]) + 1) > 4*self.samp*self.Npoint:
+            if self.grid != 'auto':
+                print('{0} is not on a regular grid, use unstructured points'.format(self.network))
+            self.grid = False
+            return
+        (u0, du, i), (v0, dv, j) = lu, lv
+        self.gt = (u0, du, v0, dv)
+        self.cells = np.full((max(j) + 1, max(i) + 1), -1, dtype=np.int64)
+        self.cells[j, i] = np.arange(self.Npoint)
+        if np.count_nonzero(self.cells >= 0) < self.Npoint:
+            print('{0}: several points within the same grid cell, use unstructured points'.format(self.network))
+            self.gt, self.cells, self.grid = None, None, False
+            return
+        self.grid = True
+        print('{0} on a regular grid of {1}x{2} cells'.format(self.network, self.cells.shape[1], self.cells.shape[0]))
+
+    def _uv(self,x,y):
+        """ Input coordinates of positions x,y """
+        if self.utm_proj is not None:
+            return self.UTM(np.asarray(x) + self.ref_x, np.asarray(y) + self.ref_y, inverse=True)
+        if self.theta:
+            return np.asarray(x), np.asarray(y)
+        return np.asarray(x)/1e3, np.asarray(y)/1e3
+
+    def window(self,prof):
+        """ Point indices within the bounding window of the swath of profile prof (grid networks) """
+        corners = np.array([[-1,-1],[1,-1],[1,1],[-1,1]])/2.
+        cx = prof.x + corners[:,0]*prof.w*prof.s[0] + corners[:,1]*prof.l*prof.n[0]
+        cy = prof.y + corners[:,0]*prof.w*prof.s[1] + corners[:,1]*prof.l*prof.n[1]
+        u, v = self._uv(cx, cy)
+        u0, du, v0, dv = self.gt
+        ny, nx = self.cells.shape
+        # one cell margin for the curvature of the edges in geographic coordinates
+        i0, i1 = int(np.floor((np.min(u) - u0)/du)) - 1, int(np.ceil((np.max(u) - u0)/du)) + 2
+        j0, j1 = int(np.floor((np.min(v) - v0)/dv)) - 1, int(np.ceil((np.max(v) - v0)/dv)) + 2
+        idx = self.cells[max(j0,0):min(j1,ny), max(i0,0):min(i1,nx)].ravel()
+        return np.sort(idx[idx >= 0])
+
+    def swaths(self,profiles,chunk=2**18):
+        """
+        Points within the swath of each profile: (index, xpp, ypp) as swath2d.swaths.
+        Grid networks only rotate the points of the bounding window of each swath
+        """
+        if self.cells is None:
+            return swaths(profiles, self.x, self.y, chunk)
+        out = []
+        for prof in profiles:
+            idx = self.window(prof)
+            index, xpp, ypp = swaths([prof], self.x[idx], self.y[idx], chunk)[0]
+            out.append((idx[index], xpp, ypp))
+        return out
+
+    def image(self,maxn=None):
+        """
+        LOS of grid networks as a 2D array for map view, decimated to about maxn cells.
+        Return x, y (cell centres, 1D if regular in x, y, 2D otherwise) and the LOS array
+        """
+        step = 1
+        if maxn is not None:
+            step = max(int(math.ceil(math.sqrt(self.cells.size/float(maxn)))), 1)
+        cells = self.cells[::step, ::step]
+        z = np.full(cells.shape, np.nan, dtype=np.float32)
+        z[cells >= 0] = self.ulos[cells[cells >= 0]]
+        u0, du, v0, dv = self.gt
+        u = u0 + du*np.arange(self.cells.shape[1])[::step]
+        v = v0 + dv*np.arange(self.cells.shape[0])[::step]
+        if self.utm_proj is not None:
+            uu, vv = np.meshgrid(u, v)
+            x, y = self.UTM(uu, vv)
+            return x - self.ref_x, y - self.ref_y, z
+        scale = 1. if self.theta else 1e3
+        return u*scale, v*scale, z
+
+    def stream(self,profiles,nbuck=1024):
+        """
+        Out-of-core profiles: read the input file by chunks of chunksize rows, project each chunk
+        in all profiles and accumulate binstats in the bins of each profile (lbins, or l/100 if
+        lbins is not defined). Keep every samp rows in memory for map view.
+        The histogram edges cover the values of the whole file, read in a first pass over the LOS column.
+        nbuck: number of histogram buckets for medians and percentiles
+        """
+        self.update_proj(self.ref)
+        insarf = self.wdir + '/' + self.network
+        if not path.exists(insarf):
+            print(f"File: {insarf} not found, Exit!")
+            sys.exit()
+        if self.theta:
+            print('theta option is not used in out-of-core mode')
+        if self.sigcol is not None:
+            print('sigcol option is not used in out-of-core mode')
+        if self.despike is not None:
+            print('despike option is not used in out-of-core mode')
+        if self.lookcol is not None:
+            print('lookcol option is not used in out-of-core mode')
+
+        # first pass: range of the values of all chunks (raster files are row-ordered,
+        # so that one chunk only covers a strip of the track)
+        vmin, vmax = np.inf, -np.inf
+        for cols in itercols(insarf, (2,), dtype=np.float32, comments='#', chunksize=self.chunksize):
+            clos = cols[0] * self.scale + self.cst
+            if np.any(~np.isnan(clos)):
+                vmin = min(vmin, np.nanpercentile(clos, 0.5))
+                vmax = max(vmax, np.nanpercentile(clos, 99.5))
+        if vmin > vmax:
+            vmin, vmax = 0., 0.
+        span = max(vmax - vmin, 1e-6)
+        # histogram edges common to all chunks
+        edges = np.linspace(vmin - span, vmax + span, nbuck + 1)
+        self.stats = []
+        for prof in profiles:
+            bins, centres = prof.bins(prof.lbins if prof.lbins is not None else prof.l/100.)
+            self.stats.append(binstats(centres, edges))
+
+        x, y, ulos = [], [], []
+        nrow = 0
+        geom = frame(profiles)
+        for cols in itercols(insarf, (0, 1, 2), dtype=np.float32, comments='#', chunksize=self.chunksize):
+            if self.utm_proj is None:
+                cx, cy = cols[0] * 1e3, cols[1] * 1e3
+            else:
+                cx, cy = self.UTM(cols[0], cols[1])
+                cx, cy = (cx - self.ref_x), (cy - self.ref_y)
+            clos = cols[2] * self.scale + self.cst
+
+            # rotate the chunk once for all profiles
+            for k, (inside, xpp, ypp) in enumerate(inswath(geom, cx, cy)):
+                bins, centres = profiles[k].bins(profiles[k].lbins if profiles[k].lbins is not None else profiles[k].l/100.)
+                # same bin convention as the in-memory profiles
+                self.stats[k].update(np.digitize(ypp, bins), clos[inside])
+
+            # map view subsample
+            keep = np.arange(nrow, nrow + len(clos)) % self.samp == 0
+            x.append(cx[keep]); y.append(cy[keep]); ulos.append(clos[keep])
+            nrow += len(clos)
+
+        self.x, self.y, self.ulos = np.concatenate(x), np.concatenate(y), np.concatenate(ulos)
+        self.Npoint = len(self.ulos)
+        outside = sum(stats.outside for stats in self.stats)
+        if outside > 0:
+            print('{0}: {1} values outside the histogram range [{2:.3f}, {3:.3f}] counted in the end buckets'.format(
+                self.network, int(outside), edges[0], edges[-1]))
+        if self.npoints is not None:
+            self.build_pyramid()
+
+    def build_pyramid(self,nlevels=8):
+        """
+        Build a multi-resolution pyramid of the LOS map. The cell size of the first level
+        is twice the average point spacing and is doubled at each level. Each level is reduced
+        from the previous one, weighted by the number of points in each cell.
+        """
+        ok = np.flatnonzero(~np.isnan(self.ulos))
+        if len(ok) == 0:
+            self.pyramid = []
+            return
+        xmin, xmax = np.min(self.x[ok]), np.max(self.x[ok])
+        ymin, ymax = np.min(self.y[ok]), np.max(self.y[ok])
+        spacing = max(math.sqrt((xmax-xmin)*(ymax-ymin)/len(ok)), 1.)
+
+        self.pyramid = []
+        x, y, z, w = self.x, self.y, self.ulos, None
+        for k in range(1,nlevels+1):
+            level = cellgrid(x,y,z,spacing*2**k,origin=[xmin,ymin],w=w)
+            self.pyramid.append(level)
+            if len(level) <= 1:
+                break
+            x, y, z, w = level.xc, level.yc, level.mean, level.count
+
+    def select(self,npoints=None):
+        """
+        Return x, y, los of the finest resolution with less than npoints points:
+        the full resolution data or the per-cell median of a pyramid level
+        """
+        if npoints is None:
+            npoints = self.npoints
+        if (npoints is None) or (not self.pyramid) or (self.Npoint <= npoints):
+            return self.x, self.y, self.ulos
+        for level in self.pyramid:
+            if len(level) <= npoints:
+                break
+        return level.xc, level.yc, level.median
+
+def _load_tile(args):
+    """
+    Worker of tilenetwork: load one tile, return every samp points for map view
+    and the points within each profile swath
+    """
+    fname, kwargs, ref, samp, geom = args
+    tile = network(network=path.basename(fname), wdir=path.dirname(fname), dim=1, ref=ref, **kwargs)
+    tile.loadinsar()
+    # same selection as the single file profiles
+    swaths = [(tile.x[inside], tile.y[inside], tile.ulos[inside]) for inside, xpp, ypp in inswath(geom, tile.x, tile.y)]
+    return tile.x[::samp], tile.y[::samp], tile.ulos[::samp], swaths
+
+class tilenetwork(network):
+    """
+    tilenetwork class: InSAR mosaic split in several tile files processed by local worker processes.
+    Each worker loads one tile and extracts the points within all profile swaths. The swath points
+    of all tiles are merged in tile order, so that profiles are the same as for a single file
+    with all tiles concatenated.
+    @Param: same as network, with
+    :network: list of tile files, directory containing the tiles or glob pattern, relative to wdir
+    :nworkers: number of worker processes, default: 1
+    :samp: subsample option for map view only, profiles use all points, default: 1
+    Workers are forked from the main thread, before the other datasets are loaded (threads are
+    used where fork is not available). theta, sigcol and lookcol are not supported.
+    """
+
+    def __init__(self,network,reduction,wdir,dim=1,nworkers=1,**kwargs):
+        super().__init__(network,reduction,wdir,dim,**kwargs)
+        self.nworkers = nworkers
+
+    def tiles(self):
+        """ Return the sorted list of tile files """
+        import glob
+        if isinstance(self.network, (list, tuple)):
+            return [path.join(self.wdir, f) for f in self.network]
+        pattern = path.join(self.wdir, self.network)
+        if path.isdir(pattern):
+            pattern = path.join(pattern, '*')
+        return sorted(f for f in glob.glob(pattern) if path.isfile(f))
+
+    def loadinsar(self,profiles=[]):
+        self.update_proj(self.ref)
+        tiles = self.tiles()
+        if len(tiles) == 0:
+            print(f"No tile found for {self.network} in {self.wdir}, Exit!")
+            sys.exit()
+
+        kwargs = {'reduction': self.reduction, 'scale': self.scale, 'cst': self.cst, 'utm_proj': self.utm_proj,
+            'despike': self.despike, 'despike_cell': self.despike_cell}
+        geom = frame(profiles)
+        args = [(fname, kwargs, self.ref, self.samp, geom) for fname in tiles]
+        nworkers = min(self.nworkers, len(tiles))
+        import multiprocessing, threading
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        if nworkers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            # fork must be called from the main thread, before other loads start their threads
+            if threading.current_thread() is not threading.main_thread():
+                raise RuntimeError('tiles of {0} must be loaded from the main thread'.format(self.reduction))
+            with ProcessPoolExecutor(max_workers=nworkers, mp_context=multiprocessing.get_context('fork')) as pool:
+                parts = list(pool.map(_load_tile, args))
+        elif nworkers > 1:
+            # spawned workers would run the input script again: use threads instead
+            with ThreadPoolExecutor(max_workers=nworkers) as pool:
+                parts = list(pool.map(_load_tile, args))
+        else:
+            parts = [_load_tile(arg) for arg in args]
+
+        # merge tiles in order
+        self.x = np.concatenate([part[0] for part in parts])
+        self.y = np.concatenate([part[1] for part in parts])
+        self.ulos = np.concatenate([part[2] for part in parts])
+        self.swath = []
+        for k in range(len(profiles)):
+            self.swath.append(tuple(np.concatenate([part[3][k][j] for part in parts]) for j in range(3)))
+        del parts
+        self.Npoint = len(self.ulos)
+        if self.npoints is not None:
+            self.build_pyramid()
+
@@ -2,18 +2,19 @@
 
 #from __future__ import print_function
 import numpy as np
-import scipy.optimize as opt
-import scipy.linalg as lst
-
-from matplotlib import pyplot as plt
-import matplotlib
-import matplotlib.cm as cm
-from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 from readgmt import *
 from network2d import *
 from model2d import *
-from readgmt import *
+from export2d import *
+from load2d import load_datasets, plan_memory
+from readconfig import load_config, check_config
+from savefig2d import figsaver, decimate, draw_image, draw_density
+from tiles2d import tilecache
+from swath2d import swaths, rotate
+from grid2d import swathgrid, clipped_stats, ramp2d
+from result2d import profresult, gpsresult, profresults
+from decomp2d import decomposition
 
 from sys import argv,exit,stdin,stdout
 import getopt
@@ -28,9 +29,31 @@ def hdi(trace, cred_mass=0.95):
     hdi_min, hdi_max = np.nanpercentile(trace,2.), np.nanpercentile(trace,98.)  
     return hdi_min, hdi_max
 
+def density_range(res,losmin,losmax):
+    # LOS range of the density profiles
+    if (losmin != None) and (losmax != None):
+      return (losmin,losmax)
+    if len(res.uulos) == 0:
+      return (-1.,1.)
+    lo,hi = np.nanpercentile(res.uulos,0.5),np.nanpercentile(res.uulos,99.5)
+    return (lo,hi) if hi > lo else (lo-1.,hi+1.)
+
+def draw_seismicity(ax,seismi,x,y,mag,extent,zorder=10):
+    # log-scaled density of the events and events larger than maglarge as markers
+    if extent is None:
+      extent = (np.nanmin(x),np.nanmax(x),np.nanmin(y),np.nanmax(y))
+    if (extent[1] <= extent[0]) or (extent[3] <= extent[2]):
+      extent = (extent[0]-1.,max(extent[1],extent[0])+1.,extent[2]-1.,max(extent[3],extent[2])+1.)
+    draw_density(ax,x,y,extent,seismi.color,shape=(int(seismi.density),int(seismi.density)),zorder=zorder)
+    if seismi.maglarge is not None:
+      large = np.flatnonzero(mag >= seismi.maglarge)
+      size = (mag[large] - np.nanmin(seismi.mag))*seismi.width*5
+      ax.scatter(x[large],y[large],s=size,c=seismi.color,marker='o',linewidths=1,edgecolor='black',alpha=0.5,label=seismi.name,zorder=zorder+1)
+
 def usage():
-  print('plotPro.py infile.py [-v] [-h]')
+  print('plotPro.py infile.py [-v] [-h] [--headless]')
   print('-v Verbose mode. Show more information about the processing')
+  print('--headless Use a non-interactive backend and do not show figures')
   print('-h Show this screen')
 
 #load input file 
@@ -41,10 +64,13 @@ except:
     sys.exit()
 
 level = 'basic'
+headless = False
 for o in sys.argv:
     if o in ("-h","--help"):
        usage()
        sys.exit()
+    if o == "--headless":
+      headless = True
     if o in ("-v","--verbose"):
       level = 'debug'
 
@@ -67,29 +93,43 @@ if 1==len(sys.argv):
   logger.critical('No input file')
   sys.exit()
 
+# no display available: non-interactive backend selected before the input file is executed
+if (sys.platform.startswith('linux')) and ('DISPLAY' not in os.environ) and ('WAYLAND_DISPLAY' not in os.environ):
+  headless = True
+
 fname=sys.argv[1]
-exec(open(fname).read())
-if len(sys.argv)>1:
-  try:
-    fname=sys.argv[1]
-    logger.info('Read input file {0}'.format(fname))
-    try:
-      sys.path.append(path.dirname(path.abspath(fname)))
-      exec ("from "+path.basename(fname)+" import *")
-    except:
-      exec(open(fname).read())
-      #execfile(path.abspath(fname))
-  
-  except Exception as e: 
-    logger.critical('Problem in input file')
+logger.info('Read input file {0}'.format(fname))
+try:
+  config = load_config(fname,headless=headless)
+except Exception as e: 
+  logger.critical('Problem in input file')
+  logger.critical(e)
+  print(network.__doc__)
+  print(topo.__doc__)
+  print(profile.__doc__)
+  print(gmt.__doc__)
+  print(shapefile.__doc__)
+  print(fault2d.__doc__)
+  sys.exit()
+
+# check input parameters before loading data
+errors = check_config(config)
+if len(errors) > 0:
+  for e in errors:
     logger.critical(e)
-    print(network.__doc__)
-    print(topo.__doc__)
-    print(profile.__doc__)
-    print(gmt.__doc__)
-    print(shapefile.__doc__)
-    print(fault2d.__doc__)
-    sys.exit()
+  logger.critical('{0} errors in input file {1}. Exit!'.format(len(errors),fname))
+  sys.exit()
+config['headless'] = headless or config.get('headless',False)
+globals().update(config)
+
+# headless mode: option --headless, headless = True in input file or no display available
+import matplotlib
+if headless:
+  logger.info('Headless mode: use non-interactive backend Agg')
+  matplotlib.use('Agg')
+from matplotlib import pyplot as plt
+import matplotlib.cm as cm
+from mpl_toolkits.axes_grid1 import make_axes_locatable
 
 if 'xmin' in locals():
   xmin =xmin*1e3; xmax=xmax*1e3
@@ -118,9 +158,32 @@ fperp=np.zeros(Mfault)
 # Info basemap
 if 'plot_basemap' not in locals():
     plot_basemap = False
+# Info offline basemap: XYZ tile directory or MBTiles file (path or tilecache instance)
+if 'basemap_tiles' not in locals():
+    basemap_tiles = None
+if isinstance(basemap_tiles,str):
+    basemap_tiles = tilecache(basemap_tiles)
 # Info export profile
 if 'export_profile' not in locals():
     export_profile = False
+# Info export format: 'txt' one text file per profile, 'h5' or 'npz' one binary file per run
+if 'export_fmt' not in locals():
+    export_fmt = 'txt'
+# Info quick-look profiles: if True, profiles are computed on the multi-resolution map of networks with npoints defined
+if 'quicklook' not in locals():
+    quicklook = False
+# Info stitching of two InSAR networks in map view: 2D ramp ('lin' or 'quad') fitted to the differences
+# of the two networks on a common grid of stitch_cell km cells in their overlap area (default: None)
+if 'stitch' not in locals():
+    stitch = None
+if 'stitch_cell' not in locals():
+    stitch_cell = 1.
+# Info flatten map format: 'npy' (binary, default) or 'txt'
+if 'flat_fmt' not in locals():
+    flat_fmt = 'npy'
+if export_profile and export_fmt != 'txt':
+    store = profstore(outdir+'/'+path.splitext(path.basename(sys.argv[1]))[0]+'_profiles', fmt=export_fmt,
+      meta={'infile': path.abspath(sys.argv[1]), 'xlim': xlim, 'ylim': ylim})
 
 # Load data
 if 'topodata' not in globals():
@@ -150,6 +213,10 @@ if 'insardata' not in globals():
     logger.warning('No insardata list defined')
 Minsar = len(insardata)
 
+# east and up networks decomposed from several InSAR networks, added to insardata after loading
+if 'decompdata' not in globals():
+    decompdata = []
+
 # if reference point for profile, then same reference point for all instances
 if profiles[0].ref is not None:
     logger.warning('Warning! You have defined a reference point for first profile.')
@@ -158,10 +225,14 @@ for i in range(len(profiles)):
     profiles[i].update_proj(profiles[0].ref)
 for i in range(len(insardata)):
     insardata[i].update_proj(profiles[0].ref)
+for i in range(len(decompdata)):
+    decompdata[i].update_proj(profiles[0].ref)
 for i in range(len(gpsdata)):
     gpsdata[i].update_proj(profiles[0].ref)
 for i in range(len(gmtfiles)):
     gmtfiles[i].update_proj(profiles[0].ref)
+for i in range(len(fmodel)):
+    fmodel[i].update_proj(profiles[0].ref)
 for i in range(len(topodata)):
     topodata[i].ref = profiles[0].ref
 for i in range(len(seismifiles)):
@@ -169,15 +240,17 @@ for i in range(len(seismifiles)):
 for i in range(len(shapefiles)):
     shapefiles[i].ref = profiles[0].ref
 
-for i in range(Mseismi):
-    seismi = seismifiles[i]
-    logger.debug('Load data {0}'.format(seismi.filename))
-    seismi.load(xlim=xlim,ylim=ylim)
-
-# load InSAR 
-for i in range(Minsar):
-    insar = insardata[i]
-    logger.debug('Load data {0}'.format(insar.network))
+def load_insar(insar):
+    if insar.chunksize is not None:
+      logger.info('Out-of-core mode for {0}: read by chunks of {1} rows'.format(insar.network,insar.chunksize))
+      insar.stream(profiles)
+      insar.uloscor = insar.ulos
+      return
+    if isinstance(insar,tilenetwork):
+      logger.info('Load {0} tiles of {1} with {2} workers'.format(len(insar.tiles()),insar.reduction,insar.nworkers))
+      insar.loadinsar(profiles)
+      insar.uloscor = insar.ulos
+      return
     insar.loadinsar()
     if insar.theta == True:
       logger.warning('Convert LOS displacements to mean LOS angle assuming \
@@ -188,21 +261,142 @@ for i in range(Minsar):
         (np.sin(np.deg2rad(insar.losm))/np.sin(np.deg2rad(insar.los)))
     else:
       insar.uloscor = insar.ulos
-    crs = insar.utm_proj
 
-Mgps = len(gpsdata)
-for i in range(Mgps):
-      gps = gpsdata[i]
-      logger.debug('Load data {0}'.format(gps.network))
-      gps.loadgps()
-      crs = gps.utm_proj       
-
-for i in range(Mtopo):
-  plot=topodata[i]
-  logger.debug('Load data {0}'.format(plot.name))
-  plot.load(xlim=xlim,ylim=ylim)
-  if len(plot.z) < 1:
+def load_topo(plot):
+    plot.load(xlim=xlim,ylim=ylim)
+    if len(plot.z) < 1:
         logger.debug('Empty data file...')
+
+def load_gmt(gmtf):
+    gmtf.fx,gmtf.fy = gmtf.load(xlim=xlim,ylim=ylim)
+
+# Info output figures: format and dpi of all figures (fig_format, fig_dpi), per-figure options
+# (fig_options, e.g. {'map': {'format': 'png', 'dpi': 300}}), number of rendering processes (fig_workers),
+# rasterization of scatter layers (rasterize), maximum number of points per scatter layer (max_scatter)
+# and number of pixels (LOS, distance) of the density profiles (density_shape)
+for key,value in [('fig_format',None),('fig_dpi',None),('fig_options',None),('fig_workers',1),('rasterize',True),('max_scatter',None),
+    ('density_shape',(200,400))]:
+  if key not in locals():
+    globals()[key] = value
+if (fig_workers > 1) and not headless:
+  logger.warning('Parallel rendering of figures is only used in headless mode')
+  fig_workers = 1
+saver = figsaver(fmt=fig_format,dpi=fig_dpi,options=fig_options,nworkers=fig_workers)
+
+# Info number of datasets loaded concurrently
+if 'nworkers' not in locals():
+    nworkers = 1
+
+# Info memory budget (GB) shared by the InSAR networks: choose samp and chunksize of each network
+# from the size of its file so that the expected peak memory stays within the budget (default: None)
+if 'memory_budget' not in locals():
+    memory_budget = None
+if memory_budget is not None:
+    # features that need the swath points of the profiles: out-of-core profiles only give binned statistics
+    nostream = None
+    if stitch is not None:
+      nostream = 'stitch'
+    elif any(prof.flat is not None for prof in profiles):
+      nostream = 'flat'
+    elif any(prof.npbin is not None for prof in profiles):
+      nostream = 'npbin'
+    elif any(prof.typ in ['grid','density'] for prof in profiles):
+      nostream = '{0} profile type'.format([prof.typ for prof in profiles if prof.typ in ['grid','density']][0])
+    elif any(gps.dim == 3 for gps in gpsdata):
+      nostream = 'GNSS co-location'
+    elif export_profile and export_fmt != 'txt':
+      nostream = 'swath export'
+    planned = [(insar,nostream) for insar in insardata if not isinstance(insar,tilenetwork) and insar.chunksize is None]
+    planned += [(insar,'decomposition') for decomp in decompdata for insar in decomp.networks]
+    peak = 0.
+    for insar,reason in planned:
+      peak += plan_memory(insar,insar.wdir+'/'+insar.network,memory_budget*2.**30/max(len(planned),1),nostream=reason)
+    logger.info('Memory budget: expected peak of the InSAR networks {0:.2f} GB for a budget of {1} GB'.format(peak/2.**30,memory_budget))
+    del planned, nostream
+
+# tiles are loaded first from the main thread: their worker processes are forked before
+# the threads of the other loads are started
+errors = load_datasets([(insar.network, lambda insar=insar: load_insar(insar)) for insar in insardata
+    if isinstance(insar,tilenetwork)], nworkers=1)
+
+tasks = []
+for seismi in seismifiles:
+    tasks.append((seismi.filename, lambda seismi=seismi: seismi.load(xlim=xlim,ylim=ylim)))
+for insar in insardata:
+    if not isinstance(insar,tilenetwork):
+        tasks.append((insar.network, lambda insar=insar: load_insar(insar)))
+for decomp in decompdata:
+    tasks.append((decomp.reduction, decomp.load))
+for gps in gpsdata:
+    tasks.append((gps.network, gps.loadgps))
+for plot in topodata:
+    tasks.append((plot.name, lambda plot=plot: load_topo(plot)))
+for shape in shapefiles:
+    tasks.append((shape.filename, shape.load))
+for gmtf in gmtfiles:
+    tasks.append((gmtf.filename, lambda gmtf=gmtf: load_gmt(gmtf)))
+
+if len(errors) == 0:
+    errors = load_datasets(tasks, nworkers=nworkers)
+if len(errors) > 0:
+    logger.critical('{0} datasets could not be loaded: {1}. Exit!'.format(len(errors),', '.join([name for name,e in errors])))
+    sys.exit(1)
+del tasks
+
+# LOS networks of the input file: the decomposed east and up networks are not flattened nor stitched
+Mlos = len(insardata)
+for decomp in decompdata:
+    logger.info('Add east and up networks of {0} to insardata'.format(decomp.reduction))
+    insardata = insardata + decomp.fields
+Minsar = len(insardata)
+
+# project GNSS into LOS with the LOS unit vectors of an InSAR network at each station
+for gps in gpsdata:
+    if gps.lookdata is None:
+      continue
+    looknet = [insar for insar in insardata if insar.reduction == gps.lookdata]
+    if (len(looknet) == 0) or (looknet[0].look is None):
+      logger.warning('No per-pixel LOS unit vectors in {0}: project {1} with proj'.format(gps.lookdata,gps.reduction))
+      continue
+    logger.info('Project {0} into LOS with the LOS unit vectors of {1}'.format(gps.reduction,gps.lookdata))
+    gps.project_los(gps.interp_look(looknet[0]))
+    del looknet
+
+# last projection defined for basemap
+for insar in insardata:
+    crs = insar.utm_proj
+Mgps = len(gpsdata)
+for gps in gpsdata:
+    crs = gps.utm_proj
+
+# STITCH
+# remove the 2D ramp between the two networks once for the whole track, before map and profiles
+if (stitch is not None) and (Mlos == 2):
+  insar1, insar2 = insardata[0], insardata[1]
+  logger.info('Stitch {0} to {1} with a {2} ramp in their overlap area'.format(insar2.reduction,insar1.reduction,stitch))
+  if (insar1.usig is not None) and (insar2.usig is not None):
+    w1, w2 = 1./insar1.usig**2, 1./insar2.usig**2
+  else:
+    w1, w2 = None, None
+  ramp = ramp2d(insar1.x,insar1.y,insar1.ulos,insar2.x,insar2.y,insar2.ulos,stitch_cell*1e3,order=stitch,w1=w1,w2=w2)
+  del w1, w2
+  if ramp.pars is None:
+    logger.warning('Not enough overlap cells ({0}) to stitch {1} and {2}'.format(len(ramp.diff),insar1.reduction,insar2.reduction))
+  else:
+    logger.info('Ramp fitted on {0} overlap cells: {1}, rms of the residual differences: {2:.3f}'.format(len(ramp.diff),ramp.pars,ramp.rms))
+    blos = ramp(insar2.x,insar2.y)
+    insar2.ulos = insar2.ulos + blos
+    insar2.uloscor = insar2.uloscor + blos
+    del blos
+    if insar2.swath is not None:
+      insar2.swath = [(px,py,plos + ramp(px,py)) for px,py,plos in insar2.swath]
+    if insar2.stats is not None:
+      logger.warning('Out-of-core profiles of {0} are not stitched, only its map'.format(insar2.reduction))
+    if insar2.pyramid is not None:
+      insar2.build_pyramid()
+elif stitch is not None:
+  logger.warning('stitch needs two LOS InSAR networks: ignored')
+
 if Mtopo == 0: 
   logger.warning('No topodata defined')
   Mtopo = 0
@@ -229,6 +423,10 @@ if 'xmin' in locals():
   ax.set_ylim(ymin,ymax)
 
 if (plot_basemap == True) and (profiles[0].ref is None):
+  if basemap_tiles is not None:
+    logger.info('Plot basemap from local tiles {0}'.format(basemap_tiles.source))
+    basemap_tiles.add_basemap(ax,crs,alpha=1,zorder=0)
+  else:
     import contextily as ctx
     ctx.add_basemap(ax,crs="EPSG:{}".format(crs), source=ctx.providers.Esri.WorldShadedRelief,alpha=1,zorder=0)
 else:
@@ -240,7 +438,7 @@ for ii in range(len(gmtfiles)):
   filename = gmtfiles[ii].filename
   color = gmtfiles[ii].color
   width = gmtfiles[ii].width
-  fx,fy = gmtfiles[ii].load(xlim=xlim,ylim=ylim)
+  fx,fy = gmtfiles[ii].fx,gmtfiles[ii].fy
   for i in range(len(fx)):
     ax.plot(fx[i],fy[i],color = color,lw = width,zorder=26)
 
@@ -266,13 +464,25 @@ if Minsar>0:
 for i in range(Minsar):
   insar=insardata[i]
   logger.info('Plot data in map view {0} between {1} and {2}'.format(insar.network, vmin, vmax))
-  logger.info('Subsample data every {0} point (samp option)'.format(insar.samp))
   norm = matplotlib.colors.Normalize(vmin=insar.lmin, vmax=insar.lmax)
+  if insar.cells is not None:
+    # regular grid: draw the LOS as an image
+    gx,gy,glos = insar.image(max_scatter)
+    logger.info('Plot {0}x{1} grid image'.format(glos.shape[1],glos.shape[0]))
+    m = draw_image(ax,gx,gy,glos,norm,cmap=cmap,zorder=1)
+    continue
+  if insar.pyramid is not None:
+    mx,my,mlos = insar.select()
+    logger.info('Plot {0} points of the multi-resolution map (npoints option)'.format(len(mlos)))
+  else:
+    mx,my,mlos = insar.x[::samp],insar.y[::samp],insar.ulos[::samp]
+    logger.info('Subsample data every {0} point (samp option)'.format(insar.samp))
   m = cm.ScalarMappable(norm = norm, cmap = cmap)
-  m.set_array(insar.ulos[::samp])
-  masked_array = np.ma.array(insar.ulos[::samp], mask=np.isnan(insar.ulos[::samp]))
+  m.set_array(mlos)
+  masked_array = np.ma.array(mlos, mask=np.isnan(mlos))
   facelos = m.to_rgba(masked_array)
-  ax.scatter(insar.x[::samp],insar.y[::samp], s=.05, marker = 'o',color = facelos, rasterized=True, label = 'LOS LOS Velocities {}'.format(insar.reduction),zorder=1)
+  mx,my,facelos = decimate(max_scatter,mx,my,facelos)
+  ax.scatter(mx,my, s=.05, marker = 'o',color = facelos, rasterized=rasterize, label = 'LOS LOS Velocities {}'.format(insar.reduction),zorder=1)
 
 gpscolor = ['black','coral','red','darkorange']
 for i in range(Mgps):
@@ -285,25 +495,18 @@ for i in range(Mgps):
           ax.text(gps.x[kk], gps.y[kk], gps.name[kk], color ='black')
 
 # add colorbar los
-if 'facelos' in locals():
+if Minsar>0:
   divider = make_axes_locatable(ax)
   c = divider.append_axes("right", size="5%", pad=0.05)
   cbar = ax.figure.colorbar(m, cax=c)
   cbar.set_label('LOS Velocities',  labelpad=15) 
 
 for ii in range(len(shapefiles)):
-  import geopandas as gpd
-  import shapely.speedups
   name = shapefiles[ii].name
-  fname = shapefiles[ii].filename
-  wdir = shapefiles[ii].wdir
   color = shapefiles[ii].color
   edgecolor = shapefiles[ii].edgecolor
   linewidth = shapefiles[ii].linewidth
-  crs = shapefiles[ii].crs
-  shape = gpd.read_file(wdir + fname)
-  if crs != None:
-    shape = shape.to_crs("EPSG:{}".format(crs))
+  shape = shapefiles[ii].shape
   shape.plot(ax=ax,facecolor='none', color=color,edgecolor=edgecolor,linewidth=linewidth,label=name,zorder=25)
 
 
@@ -312,6 +515,9 @@ for ii in range(len(seismifiles)):
   x,y = seismifiles[ii].x, seismifiles[ii].y
   wdir = seismifiles[ii].wdir
   color = seismifiles[ii].color
+  if seismifiles[ii].density is not None:
+    draw_seismicity(ax,seismifiles[ii],x,y,seismifiles[ii].mag,extent,zorder=12)
+    continue
   smin = np.nanmin(seismifiles[ii].mag)
   width = (seismifiles[ii].mag - smin)*seismifiles[ii].width*5
   ax.scatter(x,y,c=color,marker='o',s=width,linewidths=1, edgecolor='black',alpha=0.5,label=seismifiles[ii].name,zorder=12) 
@@ -322,8 +528,11 @@ if vertical_map:
   if 'xmin' in locals(): 
     ax12.set_xlim(xmin,xmax)
     ax12.set_ylim(ymin,ymax)
-  if plot_basemap == True:
-     ctx.add_basemap(ax12,crs="EPSG:{}".format(crs), source=ctx.providers.Esri.WorldTopoMap,alpha=1,zorder=0)
+  if (plot_basemap == True) and (profiles[0].ref is None):
+    if basemap_tiles is not None:
+      basemap_tiles.add_basemap(ax12,crs,alpha=1,zorder=0)
+    else:
+      ctx.add_basemap(ax12,crs="EPSG:{}".format(crs), source=ctx.providers.Esri.WorldTopoMap,alpha=1,zorder=0)
 
   for ii in range(len(gmtfiles)):
     name = gmtfiles[ii].name
@@ -331,7 +540,7 @@ if vertical_map:
     filename = gmtfiles[ii].filename
     color = gmtfiles[ii].color
     width = gmtfiles[ii].width
-    fx,fy = gmtfiles[ii].load(xlim=xlim,ylim=ylim)
+    fx,fy = gmtfiles[ii].fx,gmtfiles[ii].fy
     ax12.plot(fx[i],fy[i],color = color,lw = width,zorder=20)
     
   for i in range(Mgps):
@@ -348,15 +557,10 @@ if vertical_map:
 
   for ii in range(len(shapefiles)):
     name = shapefiles[ii].name
-    fname = shapefiles[ii].filename
-    wdir = shapefiles[ii].wdir
     color = shapefiles[ii].color
     edgecolor = shapefiles[ii].edgecolor
     linewidth = shapefiles[ii].linewidth
-    crs = shapefiles[ii].crs
-    shape = gpd.read_file(wdir + fname)
-    if crs != None:
-          shape = shape.to_crs("EPSG:{}".format(crs))
+    shape = shapefiles[ii].shape
     shape.plot(ax=ax12,facecolor='none', color=color,edgecolor=edgecolor,linewidth=linewidth,label=name,zorder=20)
 
   for ii in range(len(seismifiles)):
@@ -364,12 +568,19 @@ if vertical_map:
     x,y = seismifiles[ii].x, seismifiles[ii].y
     wdir = seismifiles[ii].wdir
     color = seismifiles[ii].color
-    smin = np.nanmin(seismifiles[ii].mag)
-    width = (seismifiles[ii].mag - smin)*seismifiles[ii].width*5
-    ax12.scatter(x,y,c=color,marker='o',s=width,linewidths=1, edgecolor='black',alpha=0.5,label=seismifiles[ii].name,zorder=10)
+    if seismifiles[ii].density is not None:
+      draw_seismicity(ax12,seismifiles[ii],x,y,seismifiles[ii].mag,extent,zorder=10)
+    else:
+      smin = np.nanmin(seismifiles[ii].mag)
+      width = (seismifiles[ii].mag - smin)*seismifiles[ii].width*5
+      ax12.scatter(x,y,c=color,marker='o',s=width,linewidths=1, edgecolor='black',alpha=0.5,label=seismifiles[ii].name,zorder=10)
 
     ax12.legend(loc = 'upper right',fontsize='x-small')
 
+# all basemaps are drawn
+if basemap_tiles is not None:
+    basemap_tiles.close()
+
 # clean some memory
 try:
     del m, masked_array
@@ -410,6 +621,21 @@ if len(seismifiles)>0:
 logger.info('Plot Profiles ....')
 
 flat = None # initiate if no profiles
+
+# profile coordinates of all datasets, rotated once for all profiles
+if 'swath_chunk' not in locals():
+    swath_chunk = 2**18
+if Mfault > 0:
+    fperps = rotate(profiles,[f.x for f in fmodel],[f.y for f in fmodel])[0]
+# results of all datasets along all profiles
+results = profresults()
+# profiles fitted by the fault models
+fitdata = [[] for j in range(Mfault)]
+for plot in list(topodata) + list(gpsdata) + list(seismifiles):
+    plot.inside = swaths(profiles,plot.x,plot.y,swath_chunk)
+for insar in insardata:
+    if insar.swath is None:
+        insar.inside = insar.swaths(profiles,swath_chunk)
 # Plot profile
 for k in range(len(profiles)): 
 
@@ -430,13 +656,8 @@ for k in range(len(profiles)):
   ypmax,ypmin=l/2,-l/2
   xpmax,xpmin=w/2,-w/2
 
-  # profile azimuth
-  profiles[k].str=(profiles[k].strike*math.pi)/180
-  profiles[k].s=[math.sin(profiles[k].str),math.cos(profiles[k].str),0]
-  profiles[k].n=[math.cos(profiles[k].str),-math.sin(profiles[k].str),0]
-
   for j in range(Mfault):
-    fperp[j]=(fmodel[j].x-profiles[k].x)*profiles[k].n[0]+(fmodel[j].y-profiles[k].y)*profiles[k].n[1]
+    fperp[j]=fperps[k,j]
 
   ax1=fig1.add_subplot(len(profiles),1,k+1)
   ax1.set_xlim([-l/2,l/2])
@@ -444,20 +665,23 @@ for k in range(len(profiles)):
   for i in range(Mtopo):
         plot=topodata[i]
 
-        # perp and par composante ref to the profile 
-        plot.ypp=(plot.x-profiles[k].x)*profiles[k].n[0]+(plot.y-profiles[k].y)*profiles[k].n[1]
-        plot.xpp=(plot.x-profiles[k].x)*profiles[k].s[0]+(plot.y-profiles[k].y)*profiles[k].s[1]
-
-        index=np.nonzero((plot.xpp>xpmax)|(plot.xpp<xpmin)|(plot.ypp>ypmax)|(plot.ypp<ypmin))
-        plotxpp,plotypp,plotz=np.delete(plot.xpp,index),np.delete(plot.ypp,index),np.delete(plot.z,index)
-        if nb == None:
-          nb = float(l/(len(plotz)/100.))
-          logger.info('Create bins every {0:.3f} km'.format(nb)) 
+        # perp and par composante ref to the profile of the points within profile
+        index,plotxpp,plotypp = plot.inside[k]
+        plotz = plot.z[index]
+        # bins of each dataset
+        nb = profiles[k].lbins
+        if profiles[k].npbin is not None:
+          bins,centres = profiles[k].count_bins(plotypp)
+          logger.info('Create {0} bins of {1} points'.format(len(bins)-1,profiles[k].npbin))
+          inds = np.digitize(plotypp,bins) - 1
         else:
-          logger.info('Set nbins to {}, defined in profile class'.format(nb))
-
-        bins = np.arange(-l/2,l/2, nb/2.)
-        inds = np.digitize(plotypp,bins)
+          if nb == None:
+            nb = float(l/(len(plotz)/100.))
+            logger.info('Create bins every {0:.3f} km'.format(nb)) 
+          else:
+            logger.info('Set nbins to {}, defined in profile class'.format(nb))
+          bins = np.arange(-l/2,l/2, nb/2.)
+          inds = np.digitize(plotypp,bins)
         distance = []
         moy_topo = []
         std_topo = []
@@ -515,12 +739,15 @@ for k in range(len(profiles)):
     wdir = seismifiles[ii].wdir
     color = seismifiles[ii].color
 
-    # project in profile
-    seismi.ypp=(x-profiles[k].x)*profiles[k].n[0]+(y-profiles[k].y)*profiles[k].n[1]
-    seismi.xpp=(x-profiles[k].x)*profiles[k].s[0]+(y-profiles[k].y)*profiles[k].s[1]
-    # select data within profile
-    index=np.nonzero((seismi.xpp>xpmax)|(seismi.xpp<xpmin)|(seismi.ypp>ypmax)|(seismi.ypp<ypmin))
-    seismi.xp,seismi.yp,depth,size=np.delete(seismi.xpp,index),np.delete(seismi.ypp,index),np.delete(seismifiles[ii].depth,index),np.delete(seismifiles[ii].mag,index)
+    # projection of the events within profile
+    seismi = seismifiles[ii]
+    index,seismi.xp,seismi.yp = seismi.inside[k]
+    depth,size = seismi.depth[index],seismi.mag[index]
+    if seismi.density is not None:
+      # depth section as a density image
+      if len(index) > 0:
+        draw_seismicity(ax4,seismi,seismi.yp,-depth,size,(-l/2,l/2,-np.nanmax(depth),-np.nanmin(depth)),zorder=10)
+      continue
     try:
       smin = np.nanmin(size)
     except:
@@ -549,41 +776,27 @@ for k in range(len(profiles)):
       gpsmax = gps.lmax
       logger.info('Load GPS {0}'.format(gps.network)) 
 
-      # perp and par composante ref to the profile 
-      gps.ypp=(gps.x-profiles[k].x)*profiles[k].n[0]+(gps.y-profiles[k].y)*profiles[k].n[1]
-      gps.xpp=(gps.x-profiles[k].x)*profiles[k].s[0]+(gps.y-profiles[k].y)*profiles[k].s[1]
-
-      # select data within profile
-      index=np.nonzero((gps.xpp>xpmax)|(gps.xpp<xpmin)|(gps.ypp>ypmax)|(gps.ypp<ypmin))
-      gps.uux,gps.uuy,gps.sigmaxx,gps.sigmayy,gps.xx,gps.yy,gps.xxp,gps.yyp=np.delete(gps.ux,index),np.delete(gps.uy,index)\
-      ,np.delete(gps.sigmax,index),np.delete(gps.sigmay,index),np.delete(gps.x,index),np.delete(gps.y,index),\
-      np.delete(gps.xpp,index),np.delete(gps.ypp,index)
-
-      # compute fault parallel and perpendicular for each profiles
-      gps.upar = gps.uux*profiles[k].s[0]+gps.uuy*profiles[k].s[1]
-      gps.uperp = gps.uux*profiles[k].n[0]+gps.uuy*profiles[k].n[1]
-      gps.sigmaperp=((gps.sigmaxx*np.cos(profiles[k].str))**2 + (gps.sigmayy*np.sin(profiles[k].str))**2)**0.5
-      gps.sigmapar=((gps.sigmaxx*np.sin(profiles[k].str))**2 + (gps.sigmayy*np.cos(profiles[k].str))**2)**0.5
+      # data within profile, fault parallel and perpendicular velocities
+      index,xpp,ypp = gps.inside[k]
+      gres = results[gps.reduction,profiles[k].name] = gpsresult(gps,index,xpp,ypp,profiles[k].str)
 
-      ax3.plot(gps.yyp,gps.upar,markers[i],color = 'blue',mew = 1.5,label =\
+      ax3.plot(gres.ypp,gres.upar,markers[i],color = 'blue',mew = 1.5,label =\
        '%s fault-parallel velocities'%gpsdata[i].reduction )
-      ax3.errorbar(gps.yyp,gps.upar,yerr = gps.sigmapar,ecolor = 'blue',barsabove = 'True',fmt = "none",alpha=.5)
-      ax3.plot(gps.yyp,gps.uperp,markers[i],color = 'green',mew = 1.5,\
+      ax3.errorbar(gres.ypp,gres.upar,yerr = gres.sigmapar,ecolor = 'blue',barsabove = 'True',fmt = "none",alpha=.5)
+      ax3.plot(gres.ypp,gres.uperp,markers[i],color = 'green',mew = 1.5,\
         label = '%s fault-perpendicular velocities'%gpsdata[i].reduction)
-      ax3.errorbar(gps.yyp,gps.uperp,yerr = gps.sigmaperp,ecolor = 'green',fmt = "none",alpha=.5)
+      ax3.errorbar(gres.ypp,gres.uperp,yerr = gres.sigmaperp,ecolor = 'green',fmt = "none",alpha=.5)
 
-      logger.debug('Number of GPS left within profile {0}'.format(len(gps.yyp))) 
+      logger.debug('Number of GPS left within profile {0}'.format(len(gres.ypp))) 
 
       if 3 == gps.dim:
-          gps.uuv,gps.sigmavv,gps.uu,gps.slos = np.delete(gps.uv,index), np.delete(gps.sigmav,index),np.delete(gps.ulos,index),np.delete(gps.sigmalos,index)
+          ax3.plot(gres.ypp,gres.uv,markers[i],color = 'red',mew = 1.5,label = '%s vertical velocities'%gpsdata[i].reduction)
+          ax3.errorbar(gres.ypp,gres.uv,yerr = gres.sigmav,ecolor = 'red',fmt = "none",alpha=.5)          
 
-          ax3.plot(gps.yyp,gps.uuv,markers[i],color = 'red',mew = 1.5,label = '%s vertical velocities'%gpsdata[i].reduction)
-          ax3.errorbar(gps.yyp,gps.uuv,yerr = gps.sigmavv,ecolor = 'red',fmt = "none",alpha=.5)          
-
-          if gps.proj != None:
+          if gps.projected:
             # plot gps los
-            ax2.plot(gps.yyp,gps.uu,'+',color='red',mew=2.,label='%s GPS LOS'%gpsdata[i].reduction)
-            ax2.errorbar(gps.yyp,gps.uu,yerr = gps.slos,ecolor ='red',fmt = "none")          
+            ax2.plot(gres.ypp,gres.los,'+',color='red',mew=2.,label='%s GPS LOS'%gpsdata[i].reduction)
+            ax2.errorbar(gres.ypp,gres.los,yerr = gres.slos,ecolor ='red',fmt = "none")          
 
       for j in range(Mfault):
           ax3.plot([fperp[j],fperp[j]],[gpsmax,gpsmin],color='red')
@@ -610,37 +823,57 @@ for k in range(len(profiles)):
 
       logger.info('Load InSAR {0}'.format(insar.network)) 
 
-      # perp and par composante ref to the profile 
-      insar.ypp=(insar.x-profiles[k].x)*profiles[k].n[0]+(insar.y-profiles[k].y)*profiles[k].n[1]
-      insar.xpp=(insar.x-profiles[k].x)*profiles[k].s[0]+(insar.y-profiles[k].y)*profiles[k].s[1]
+      # quick-look profiles on the multi-resolution map, final profiles on all points
+      if insar.swath is not None:
+        # tile-sharded network: swath points extracted by the tile workers
+        px,py,plos = insar.swath[k]
+        index,xpp,ypp = swaths([profiles[k]],px,py,swath_chunk)[0]
+      elif quicklook and insar.pyramid is not None:
+        px,py,plos = insar.select()
+        logger.info('Quick-look profile on {0} points of the multi-resolution map'.format(len(plos)))
+        index,xpp,ypp = swaths([profiles[k]],px,py,swath_chunk)[0]
+      else:
+        px,py,plos = insar.x,insar.y,insar.ulos
+        index,xpp,ypp = insar.inside[k]
 
-      # select data within profile
-      index=np.nonzero((insar.xpp>xpmax)|(insar.xpp<xpmin)|(insar.ypp>ypmax)|(insar.ypp<ypmin))
-      insar.uu,insar.xx,insar.yy,insar.xxpp,insar.yypp=np.delete(insar.ulos,index),np.delete(insar.x,index),\
-      np.delete(insar.y,index),np.delete(insar.xpp,index),np.delete(insar.ypp,index)
+      # data within profile and per-pixel uncertainties of the full resolution points
+      if px is insar.x:
+        sig = insar.usig[index] if insar.usig is not None else None
+        res = profresult(index,xpp,ypp,plos[index],sig)
+      else:
+        res = profresult(None,xpp,ypp,plos[index])
+      results[insar.reduction,profiles[k].name] = res
 
-      logger.debug('Number of InSAR point left within profile {0}'.format(len(insar.uu))) 
+      logger.debug('Number of InSAR point left within profile {0}'.format(len(res.los))) 
       
       for j in range(Mgps):
         gps=gpsdata[j]
+        gres = results[gps.reduction,profiles[k].name]
         if 3 == gps.dim:
           fig7=plt.figure(20,figsize=(12,4))
           ax7=fig7.add_subplot(1,len(profiles),1+k)
+          # co-locate GNSS on the multi-resolution map if defined
+          if insar.pyramid is not None:
+            cx,cy,clos = insar.select()
+            cypp,cxpp = rotate([profiles[k]],cx,cy)
+            cypp,cxpp = cypp[0],cxpp[0]
+          else:
+            cxpp,cypp,clos = res.xpp,res.ypp,res.los
           los = []; gpslos = []; sigmalos = []; gpssigmalos = []
-          for jj in range(len(gps.uu)):
+          for jj in range(len(gres.los)):
             # select data within gps
             # loop over window size
             moy_los = np.isnan; ws = 0
             while ws < 5000 : 
                 ws = ws + 2000
-                index = np.nonzero((insar.xxpp>gps.xxp[jj]+ws)|(insar.xxpp<gps.xxp[jj]-ws)|(insar.yypp<gps.yyp[jj]-ws)|(insar.yypp>gps.yyp[jj]+ws))
-                moy_los = np.nanmedian(np.delete(insar.uu,index))
+                index = np.nonzero((cxpp>gres.xpp[jj]+ws)|(cxpp<gres.xpp[jj]-ws)|(cypp<gres.ypp[jj]-ws)|(cypp>gres.ypp[jj]+ws))
+                moy_los = np.nanmedian(np.delete(clos,index))
                 if (moy_los != np.isnan):
                     ws = 6000
             los.append(moy_los)
-            sigmalos.append(np.nanstd(np.delete(insar.uu,index)))
-            gpslos.append(gps.uu[jj])
-            gpssigmalos.append(gps.slos[jj])
+            sigmalos.append(np.nanstd(np.delete(clos,index)))
+            gpslos.append(gres.los[jj])
+            gpssigmalos.append(gres.slos[jj])
          
           los,gpslos,sigmalos,gpssigmalos = np.asarray(los),np.asarray(gpslos),np.asarray(sigmalos),np.asarray(gpssigmalos)
           index = np.nonzero((~np.isnan(los)))
@@ -655,90 +888,97 @@ for k in range(len(profiles)):
           ax7.plot(lim,lim,'-r')
           ax7.fill_between(lim,lim-2,lim+2,alpha=0.3,color='dodgerblue')
  
-      # Initialise for plot in case no data for this profile
-      insar.distance = []
-      insar.moy_los = []
-      insar.std_los = []
-      insar.xperp = []
-      insar.yperp = []
-      insar.uulos =  []    
-
-      if len(insar.uu) > 50:
-
-        if nb == None:
-          nb = float(l/(len(insar.uu)/100.))
-          logger.info('Create bins every {0:.3f} km'.format(nb)) 
+      if insar.stats is not None:
+        # out-of-core statistics accumulated while reading the file
+        stats = insar.stats[k]
+        moy_los,std_los = stats.clipped(insar.perc)
+        kk = np.flatnonzero(stats.count > 10)
+        logger.info('Out-of-core profile: {0} points within {1} bins'.format(int(np.sum(stats.count)),len(kk)))
+        if profiles[k].npbin is not None:
+          logger.warning('Adaptive bins are not used in out-of-core mode')
+        res.distance,res.moy_los,res.std_los = stats.centres[kk],moy_los[kk],std_los[kk]
+        res.width = np.full(len(kk),profiles[k].lbins if profiles[k].lbins is not None else l/100.)
+        res.err_los = std_los[kk]/np.sqrt(stats.count[kk])
+        # exact statistics of all the points of the bins
+        res.count,res.mean_los,res.std_all = stats.count[kk],stats.mean[kk],stats.std[kk]
+
+      elif len(res.los) > 50:
+
+        # bins of each dataset
+        nb = profiles[k].lbins
+        r0 = results.get((insardata[0].reduction,profiles[k].name))
+        # flattening between two networks: bins of the first network for common distances
+        common = (flat != None) and (Mlos == 2) and (i == 1) and (len(r0.bins) > 1)
+        if profiles[k].npbin is not None:
+          if common:
+            bins = r0.bins
+            logger.info('Use the {0} bins of {1}'.format(len(bins)-1,insardata[0].reduction))
+          else:
+            bins,centres = profiles[k].count_bins(res.ypp[~np.isnan(res.los)])
+            logger.info('Create {0} bins of {1} points'.format(len(bins)-1,profiles[k].npbin))
+          centres = bins[:-1] + (bins[1:] - bins[:-1])/2.
+          inds = np.digitize(res.ypp,bins) - 1
         else:
-          logger.info('Set nbins to {} defined in profile class'.format(nb)) 
-
-        bins = np.arange(-l/2-1,l/2+1,nb)
-        inds = np.digitize(insar.yypp,bins)
- 
-        for j in range(len(bins)-1):
-            uu = np.flatnonzero(inds == j)
-            # remove NaN
-            kk = np.flatnonzero(~np.isnan(insar.uu[uu]))
-            _los = np.copy(insar.uu[uu][kk])
-            _xperp = np.copy(insar.xxpp[uu][kk])
-            _yperp = np.copy(insar.yypp[uu][kk])
-
-            
-            if len(kk)>10:
-            #if len(kk)>150:
-                insar.distance.append(bins[j] + (bins[j+1] - bins[j])/2.)
-
-                indice = np.flatnonzero(np.logical_and(_los>np.percentile(\
-                  _los,100-insar.perc),_los<np.percentile(_los,insar.perc)))
-
-                insar.std_los.append(np.nanstd(_los[indice]))
-                insar.moy_los.append(np.nanmedian(_los[indice]))
-                insar.xperp.append(_xperp[indice])
-                insar.yperp.append(_yperp[indice])
-                insar.uulos.append(_los[indice])
+          if common:
+            bins = r0.bins
+            logger.info('Use the {0} bins of {1}'.format(len(bins)-1,insardata[0].reduction))
+          else:
+            if nb == None:
+              nb = float(l/(len(res.los)/100.))
+              logger.info('Create bins every {0:.3f} km'.format(nb)) 
             else:
-                logger.debug('{} points within the bin'.format(len(kk)))
-                logger.debug('Less than 10 points within the bin. Nothing to be plot')
-
-        del _los; del _xperp; del _yperp
-
-        try:
-            insar.xperp = np.concatenate(insar.xperp)
-            insar.yperp = np.concatenate(insar.yperp)
-            insar.uulos = np.concatenate(insar.uulos)
-            insar.distance = np.asarray(insar.distance)
-            insar.std_los = np.asarray(insar.std_los)
-            insar.moy_los = np.asarray(insar.moy_los)
-        except:
-            #pass
-            insar.xperp = np.array(insar.xperp)
-            insar.yperp = np.array(insar.yperp)
-            insar.uulos = np.array(insar.uulos)
-            insar.distance = np.array(insar.distance)
-            insar.std_los = np.array(insar.std_los)
-            insar.moy_los = np.array(insar.moy_los)
+              logger.info('Set nbins to {} defined in profile class'.format(nb)) 
+            bins = np.arange(-l/2-1,l/2+1,nb)
+          centres = bins[:-1] + (bins[1:] - bins[:-1])/2.
+          inds = np.digitize(res.ypp,bins)
+
+        # clipped median and standard deviation of all bins at once, weighted by 1/sigma**2 if defined
+        if res.sig is not None:
+          logger.info('Weight bins by per-pixel uncertainties')
+          weights = 1./res.sig.astype(np.float64)**2
+        else:
+          weights = None
+        keep,valid,moy_los,std_los,err_los = clipped_stats(inds,res.los,len(bins)-1,insar.perc,w=weights)
+        jj = np.flatnonzero(valid)
+        logger.debug('{} bins with less than 10 points. Nothing to be plot'.format(np.sum(~valid)))
+        res.distance = centres[jj]
+        res.width = bins[jj+1] - bins[jj]
+        res.moy_los,res.std_los,res.err_los = moy_los[jj],std_los[jj],err_los[jj]
+
+        # points used, in bin order
+        kk = np.flatnonzero(keep)
+        res.used = kk[np.argsort(inds[kk],kind='stable')]
+        res.bins = bins
 
       else:
           logger.critical('Number of InSAR points inferior to 50 for track {}. Exit plot profile!'.format(insar.reduction)) 
 
   # FLATEN
-  if (flat != None):
+  if (flat != None) and (Mlos == 0):
+    logger.warning('flat needs LOS InSAR networks: decomposed networks are not flattened')
+  if (flat != None) and (Mlos > 0):
 
     # remove ramp between two profiles
-    if len(insardata)==2:
+    if Mlos==2:
 
       logger.info('Flat is not None and 2 InSAR network defined: flattening based on the differences in the overlapping areas')
       insar1, insar2 = insardata[0], insardata[1]
+      r1, r2 = results[insar1.reduction,profiles[k].name], results[insar2.reduction,profiles[k].name]
 
-      kk2 = np.flatnonzero(np.in1d(insar2.distance, insar1.distance))
-      kk1 = np.flatnonzero(np.in1d(insar1.distance, insar2.distance))
+      kk2 = np.flatnonzero(np.in1d(r2.distance, r1.distance))
+      kk1 = np.flatnonzero(np.in1d(r1.distance, r2.distance))
 
-      temp_los = insar1.moy_los[kk1] - insar2.moy_los[kk2]
-      temp_yp = insar1.distance[kk1]
-      temp_std = np.sqrt(insar1.std_los[kk1]**2 + insar2.std_los[kk2]**2)      
+      temp_los = r1.moy_los[kk1] - r2.moy_los[kk2]
+      temp_yp = r1.distance[kk1]
+      if (insar1.usig is not None) and (insar2.usig is not None):
+        # propagated standard errors of the weighted bins
+        temp_std = np.sqrt(r1.err_los[kk1]**2 + r2.err_los[kk2]**2)
+      else:
+        temp_std = np.sqrt(r1.std_los[kk1]**2 + r2.std_los[kk2]**2)      
 
       # # cut longueurs tracks
-      kmax1,kmax2=np.max(insar1.distance), np.max(insar2.distance)
-      kmin1,kmin2=np.min(insar1.distance), np.min(insar2.distance)
+      kmax1,kmax2=np.max(r1.distance), np.max(r2.distance)
+      kmin1,kmin2=np.min(r1.distance), np.min(r2.distance)
       kmax,kmin = np.min([kmax1,kmax2]), np.max([kmin1,kmin2])
 
     # remove ramp along profile on one LOS
@@ -746,21 +986,25 @@ for k in range(len(profiles)):
 
       logger.info('Flat is not None and 1 InSAR network defined: flattening along the profile')
       insar2 = insardata[0]
-      kmax,kmin = np.max(insar2.distance), np.min(insar2.distance)
+      r2 = results[insar2.reduction,profiles[k].name]
+      kmax,kmin = np.max(r2.distance), np.min(r2.distance)
 
       if loc_ramp=="positive":
         logger.info('Estimate ramp in the postive distances of the profile')
-        kk2 = np.nonzero((insar2.distance>0))
+        kk2 = np.nonzero((r2.distance>0))
       elif loc_ramp=="negative":
         logger.info('Estimate ramp in the negative distances of the profile')
-        kk2 = np.nonzero((insar2.distance<0))
+        kk2 = np.nonzero((r2.distance<0))
       else:
         logger.info('Estimate ramp within the whole profile')
-        kk2 = np.arange(len(insar2.distance))
+        kk2 = np.arange(len(r2.distance))
 
-      temp_los = insar2.moy_los[kk2]
-      temp_yp = insar2.distance[kk2]
-      temp_std = insar2.std_los[kk2]
+      temp_los = r2.moy_los[kk2]
+      temp_yp = r2.distance[kk2]
+      if insar2.usig is not None:
+        temp_std = r2.err_los[kk2]
+      else:
+        temp_std = r2.std_los[kk2]
 
     # temp_std = np.ones(len(temp_yp))
     # Cd = np.diag(temp_std**2,k=0)
@@ -768,6 +1012,9 @@ for k in range(len(profiles)):
     kk = np.flatnonzero(~np.isnan(temp_los))
     temp_los,temp_yp,temp_std = temp_los[kk],temp_yp[kk],temp_std[kk]
    
+    # distances along profile of all points to remove the ramp
+    insar2.ypp = rotate([profiles[k]],insar2.x,insar2.y)[0][0]
+
     if flat == 'quad': 
         G = np.zeros((len(temp_los),3))
         G[:,0] = temp_yp**2
@@ -784,6 +1031,8 @@ for k in range(len(profiles)):
         G[:,0] = temp_yp
         G[:,1] = 1
 
+    import scipy.optimize as opt
+    import scipy.linalg as lst
     try:
       x0 = lst.lstsq(G,temp_los)[0]
     except Exception as e:
@@ -794,20 +1043,19 @@ for k in range(len(profiles)):
     _func = lambda x: np.sum(((np.dot(G,x)-temp_los)/temp_std)**2)
     _fprime = lambda x: 2*np.dot(G.T/temp_std, (np.dot(G,x)-temp_los[::])/temp_std)
     pars = opt.fmin_slsqp(_func,x0,fprime=_fprime,iter=2000,full_output=True,iprint=0)[0]
+    r2.ramp = pars
     
     if flat == 'quad':
         a = pars[0]; b = pars[1]; c = pars[2]
         logger.info('Remove ramp: {0} yperp**2  + {1} yperp  + {2}'.format(a,b,c))
 
-        blos = a*insar2.distance**2 + b*insar2.distance + c
-        insar2.moy_los = insar2.moy_los + blos
+        blos = a*r2.distance**2 + b*r2.distance + c
+        r2.moy_los = r2.moy_los + blos
         diff = temp_los - blos[kk]
 
-        blos = a*insar2.yperp**2 + b*insar2.yperp + c
-        insar2.uulos = insar2.uulos + blos
 
-        blos = a*insar2.yypp**2 + b*insar2.yypp + c
-        insar2.uu = insar2.uu + blos
+        blos = a*r2.ypp**2 + b*r2.ypp + c
+        r2.los = r2.los + blos
 
         blos = a*insar2.ypp**2 + b*insar2.ypp + c
         insar2.ulos = insar2.ulos + blos
@@ -820,15 +1068,13 @@ for k in range(len(profiles)):
         a = pars[0]; b = pars[1]; c = pars[2]; d =pars[3]
         logger.info('Remove ramp: {0} yperp**3 + {1} yperp**2  + {2} yperp  + {3}'.format(a,b,c,d))
     
-        blos = a*insar2.distance**3 + b*insar2.distance**2 + c*insar2.distance + d
-        insar2.moy_los = insar2.moy_los + blos
+        blos = a*r2.distance**3 + b*r2.distance**2 + c*r2.distance + d
+        r2.moy_los = r2.moy_los + blos
         diff = temp_los - blos[kk]
 
-        blos = a*insar2.yperp**3 + b*insar2.yperp**2 + c*insar2.yperp + d
-        insar2.uulos = insar2.uulos + blos
 
-        blos = a*insar2.yypp**3 + b*insar2.yypp**2 + c*insar2.yypp + d
-        insar2.uu = insar2.uu + blos
+        blos = a*r2.ypp**3 + b*r2.ypp**2 + c*r2.ypp + d
+        r2.los = r2.los + blos
 
         blos = a*insar2.ypp**3 + b*insar2.ypp**2 + c*insar2.ypp + d
         insar2.ulos = insar2.ulos + blos
@@ -841,15 +1087,13 @@ for k in range(len(profiles)):
         a = pars[0]; b = pars[1]
         logger.info('Remove ramp: {0} yperp  + {1}'.format(a,b))
     
-        blos = a*insar2.distance + b
-        insar2.moy_los = insar2.moy_los + blos
+        blos = a*r2.distance + b
+        r2.moy_los = r2.moy_los + blos
         diff = temp_los - blos[kk]
         
-        blos = a*insar2.yperp + b
-        insar2.uulos = insar2.uulos + blos
 
-        blos = a*insar2.yypp + b
-        insar2.uu = insar2.uu + blos
+        blos = a*r2.ypp + b
+        r2.los = r2.los + blos
 
         blos = a*insar2.ypp + b
         insar2.ulos = insar2.ulos + blos
@@ -858,7 +1102,7 @@ for k in range(len(profiles)):
         x = np.arange(kmin,kmax,1)
         ysp = a*x + b
 
-    if len(insardata)==2:
+    if Mlos==2:
 
         # Plot histogram
         fig5=plt.figure(5,figsize=(9,6))
@@ -877,56 +1121,85 @@ for k in range(len(profiles)):
         ax4.legend(loc='best')
         ax4.set_xlim(math.floor(np.nanmin(diff)),math.ceil(np.nanmax(diff)))
         logger.debug('Save {0} output file'.format(outdir+profiles[0].name+'_'+flat+'_histo.eps'))
-        fig5.savefig(outdir+'/'+profiles[0].name+'_'+flat+'_histo.eps', format='EPS',dpi=150)
+        saver.add('histo',fig5,outdir+'/'+profiles[0].name+'_'+flat+'_histo',fmt='eps',dpi=150)
     
     # plot ramp
     ax2.plot(x,ysp,color='red',lw=1.,label='Estimated ramp')
 
   for i in range(Minsar):
         insar=insardata[i]
+        res=results[insar.reduction,profiles[k].name]
         losmin=insar.lmin
         losmax=insar.lmax
 
-        if (flat != None) and len(insardata)==2:
+        if (flat != None) and (Mlos==2) and (i < 2):
             logger.info('Plot InSAR with std option')
             # plot mean and standard deviation
-            ax2.plot(insar.distance,insar.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
-            ax2.plot(insar.distance,insar.moy_los-insar.std_los,color=insar.color,lw=.5)
-            ax2.plot(insar.distance,insar.moy_los+insar.std_los,color=insar.color,lw=.5)
-            ax2.scatter(insar.yperp,insar.uulos,s = .01, marker='o',alpha=0.1,color=insar.color,rasterized=True)
+            ax2.plot(res.distance,res.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
+            ax2.plot(res.distance,res.moy_los-res.std_los,color=insar.color,lw=.5)
+            ax2.plot(res.distance,res.moy_los+res.std_los,color=insar.color,lw=.5)
+            if typ == 'density':
+              draw_density(ax2,res.yperp,res.uulos,(-l/2,l/2)+density_range(res,losmin,losmax),'grey',shape=density_shape,zorder=1)
+            else:
+              ax2.scatter(*decimate(max_scatter,res.yperp,res.uulos),s = .01, marker='o',alpha=0.1,color=insar.color,rasterized=rasterize)
 
         else:
-          if len(insar.distance) >0:
+          if len(res.distance) >0:
             # PLOT
             if typ == 'distscale':
               logger.info('Plot InSAR with distscale option')
               # colorscale fct of the parrallel distance to the profile
               norm = matplotlib.colors.Normalize(vmin=xpmin, vmax=xpmax)
               m1 = cm.ScalarMappable(norm=norm,cmap='cubehelix_r')
-              m1.set_array(insar.xperp)
-              facelos=m1.to_rgba(insar.xperp)
-              ax2.scatter(insar.yperp,insar.uulos,s = .1, marker='o',alpha=0.4,\
-                 label=insardata[i].reduction,color=facelos, rasterized=True)
+              m1.set_array(res.xperp)
+              facelos=m1.to_rgba(res.xperp)
+              syperp,suulos,facelos = decimate(max_scatter,res.yperp,res.uulos,facelos)
+              ax2.scatter(syperp,suulos,s = .1, marker='o',alpha=0.4,\
+                 label=insardata[i].reduction,color=facelos, rasterized=rasterize)
+            
+            elif typ == 'grid':
+              # image of the swath binned along and across profile
+              res.grid = swathgrid(res.ypp,res.xpp,res.los,l,w,np.median(res.width) if len(res.width) > 0 else l/100.,profiles[k].wbins)
+              logger.info('Plot InSAR with grid option: {0}x{1} bins'.format(len(res.grid.along),len(res.grid.across)))
+              # image in its own figure (distances along and across profile), median on the LOS profile
+              figg = plt.figure('grid-{0}-{1}'.format(insar.reduction,profiles[k].name),figsize=(10,4))
+              axg = figg.add_subplot(1,1,1)
+              m1 = axg.imshow(res.grid.mean,extent=res.grid.extent,origin='lower',aspect='auto',cmap=cmap,
+                vmin=losmin,vmax=losmax,interpolation='nearest')
+              axg.set_xlim([-l/2,l/2]); axg.set_ylim([-w/2,w/2])
+              axg.set_xlabel('Distance along profile (km)'); axg.set_ylabel('Distance across profile (km)')
+              axg.set_title('{0} {1}'.format(insar.reduction,profiles[k].name))
+              figg.colorbar(m1,ax=axg,shrink=0.8,aspect=10,label='LOS Velocities')
+              saver.add('grid',figg,outdir+'/'+profiles[k].name+'-'+insar.reduction+'-pro-grid',fmt='pdf',dpi=150)
+              ax2.plot(res.distance,res.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
             
+            elif typ == 'density':
+              logger.info('Plot InSAR with density option')
+              # log-scaled density of the points in grey under the median and standard deviation in the network color
+              draw_density(ax2,res.yperp,res.uulos,(-l/2,l/2)+density_range(res,losmin,losmax),'grey',shape=density_shape,zorder=1)
+              ax2.plot(res.distance,res.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
+              ax2.plot(res.distance,res.moy_los-res.std_los,color=insar.color,lw=.5)
+              ax2.plot(res.distance,res.moy_los+res.std_los,color=insar.color,lw=.5)
+
             elif typ == 'std':
               logger.info('Plot InSAR with std option')
               # plot mean and standard deviation
-              ax2.plot(insar.distance,insar.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
-              ax2.plot(insar.distance,insar.moy_los-insar.std_los,color=insar.color,lw=.5)
-              ax2.plot(insar.distance,insar.moy_los+insar.std_los,color=insar.color,lw=.5)
+              ax2.plot(res.distance,res.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
+              ax2.plot(res.distance,res.moy_los-res.std_los,color=insar.color,lw=.5)
+              ax2.plot(res.distance,res.moy_los+res.std_los,color=insar.color,lw=.5)
 
             elif typ == 'stdscat':
               logger.info('Plot InSAR with stdscat option')
               # plot mean and standard deviation
-              ax2.plot(insar.distance,insar.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
-              ax2.scatter(insar.yperp,insar.uulos,s = .1, marker='o',alpha=0.1,color=insar.color,rasterized=True)
-              ax2.plot(insar.distance,insar.moy_los-insar.std_los,color='black',lw=.5)
-              ax2.plot(insar.distance,insar.moy_los+insar.std_los,color='black',lw=.5)
+              ax2.plot(res.distance,res.moy_los,color=insar.color,lw=2.,label=insardata[i].reduction)
+              ax2.scatter(*decimate(max_scatter,res.yperp,res.uulos),s = .1, marker='o',alpha=0.1,color=insar.color,rasterized=rasterize)
+              ax2.plot(res.distance,res.moy_los-res.std_los,color='black',lw=.5)
+              ax2.plot(res.distance,res.moy_los+res.std_los,color='black',lw=.5)
 
             else:
               # plot scattering plot
               logger.info('No type profile give. Plot InSAR scatter point')
-              ax2.scatter(insar.yperp,insar.uulos,s = .1, marker='o',alpha=0.4,color=insar.color,rasterized=True)
+              ax2.scatter(*decimate(max_scatter,res.yperp,res.uulos),s = .1, marker='o',alpha=0.4,color=insar.color,rasterized=rasterize)
 
             cst+=1.
           
@@ -935,9 +1208,7 @@ for k in range(len(profiles)):
           logger.debug('Set ylim InSAR profile to {0}-{1}'.format(losmin,losmax))
           ax2.set_ylim([losmin,losmax])
 
-        print('Profile: {}, Mean: {}, 2th perc:{}, 98th perc: {}:'.format(profiles[k].name, np.nanmean(insar.moy_los), np.nanpercentile(insar.moy_los,98),np.nanpercentile(insar.moy_los,2)))
-        if export_profile:
-          np.savetxt(outdir+'{}_{}.txt'.format(insardata[i].reduction,profiles[k].name), np.vstack([insar.distance,insar.moy_los,insar.std_los]).T, header = '# yperp (km)      los         std_los', fmt='%.6f')
+        print('Profile: {}, Mean: {}, 2th perc:{}, 98th perc: {}:'.format(profiles[k].name, np.nanmean(res.moy_los), np.nanpercentile(res.moy_los,98),np.nanpercentile(res.moy_los,2)))
 
   if Minsar>0:
     for j in range(Mfault):
@@ -954,39 +1225,140 @@ for k in range(len(profiles)):
     else:
       ax2.legend(loc='best')
 
+  # data fitted by the fault models, inverted once all profiles are computed
+  for j in range(Mfault):
+    fault = fmodel[j]
+    if fault.model is None:
+      continue
+    # distances perpendicular to the fault
+    if getattr(fault,'strike',None) is not None:
+      cosf = abs(math.cos(math.radians(profiles[k].strike - fault.strike)))
+    else:
+      cosf = 1.
+    if fault.fit == 'gps' and Mgps>0:
+      g = results[gpsdata[0].reduction,profiles[k].name]
+      if fault.model == 'screw':
+        fitdata[j].append(((g.ypp-fperp[j])*cosf, g.upar, g.sigmapar, ax3, cosf))
+      else:
+        fitdata[j].append(((g.ypp-fperp[j])*cosf, g.uperp, g.sigmaperp, ax3, cosf))
+    elif fault.fit == 'insar' and Minsar>0:
+      ins = results[insardata[0].reduction,profiles[k].name]
+      fitdata[j].append(((np.asarray(ins.distance)-fperp[j])*cosf, ins.moy_los, ins.std_los, ax2, cosf))
+    else:
+      fitdata[j].append((np.array([]), np.array([]), np.array([]), None, cosf))
+
+# fault models: grid search of locking depths and linear inversion of rates for all profiles at once
+for j in range(Mfault):
+  fault = fmodel[j]
+  if fault.model is None or len(fitdata[j]) == 0:
+    continue
+  logger.info('Fit {0} model of fault {1} on {2} profiles'.format(fault.model,fault.name,fault.fit))
+  fault.invert([f[0] for f in fitdata[j]],[f[1] for f in fitdata[j]],[f[2] for f in fitdata[j]],los=(fault.fit == 'insar'))
+  for k in range(len(profiles)):
+    logger.info('Profile {0}: locking depth {1:.1f} km, rates and offset {2}, rms {3:.3f}'.format(profiles[k].name,
+      fault.depth[k]/1e3,fault.pars[k],fault.rms[k]))
+    axf, cosf = fitdata[j][k][3], fitdata[j][k][4]
+    if (axf is None) or np.isnan(fault.depth[k]):
+      continue
+    xx = np.linspace(-profiles[k].l/2,profiles[k].l/2,500)
+    axf.plot(xx,fault.forward((xx-fperps[k,j])*cosf,k),'--',color=fault.color,lw=1.5,
+      label='{0} {1} model, D={2:.1f} km'.format(fault.name,fault.model,fault.depth[k]/1e3))
+  if export_profile:
+    np.savetxt(outdir+'/{}_model.txt'.format(fault.name),np.column_stack([fault.depth/1e3,fault.rms,fault.pars]),
+      header='# profiles: {}\n# depth (km)  rms  rates  offset'.format(' '.join(prof.name for prof in profiles)),fmt='%.6f')
+
+# export profiles of all InSAR networks
+if export_profile:
+  for k in range(len(profiles)):
+    for insar in insardata:
+      res = results.get((insar.reduction,profiles[k].name))
+      if res is None:
+        continue
+      if export_fmt == 'txt':
+        if profiles[k].npbin is not None:
+          # adaptive bins: export the bin edges
+          cols = [res.distance,res.moy_los,res.std_los,res.err_los,res.distance-res.width/2.,res.distance+res.width/2.]
+          np.savetxt(outdir+'{}_{}.txt'.format(insar.reduction,profiles[k].name), np.vstack(cols).T, header = '# yperp (km)      los         std_los     err_los     ymin     ymax', fmt='%.6f')
+        elif insar.stats is not None:
+          # out-of-core profiles: exact count, mean and standard deviation of the bins
+          np.savetxt(outdir+'{}_{}.txt'.format(insar.reduction,profiles[k].name), np.vstack([res.distance,res.moy_los,res.std_los,res.count,res.mean_los,res.std_all]).T, header = '# yperp (km)      los         std_los     count     mean_los     std_all', fmt='%.6f')
+        elif insar.usig is not None:
+          np.savetxt(outdir+'{}_{}.txt'.format(insar.reduction,profiles[k].name), np.vstack([res.distance,res.moy_los,res.std_los,res.err_los]).T, header = '# yperp (km)      los         std_los     err_los', fmt='%.6f')
+        else:
+          np.savetxt(outdir+'{}_{}.txt'.format(insar.reduction,profiles[k].name), np.vstack([res.distance,res.moy_los,res.std_los]).T, header = '# yperp (km)      los         std_los', fmt='%.6f')
+        if res.grid is not None:
+          along,across = np.meshgrid(res.grid.along,res.grid.across)
+          kk = np.flatnonzero(res.grid.count > 0)
+          np.savetxt(outdir+'{}_{}_grid.txt'.format(insar.reduction,profiles[k].name),
+            np.vstack([along.flat[kk],across.flat[kk],res.grid.mean.flat[kk],res.grid.std.flat[kk],res.grid.count.flat[kk]]).T,
+            header = '# yperp      xperp      los         std_los     count', fmt='%.6f')
+      else:
+        store.add(profiles[k],insar,res)
+
+if export_profile and export_fmt != 'txt':
+  logger.info('Save profiles in {0}'.format(store.fname))
+  store.write()
+
 if 'ax7' in locals():
     ax7.set_xlabel('InSAR: {}'.format(insar.reduction))
     ax7.set_ylabel('GPS: {}'.format(gps.reduction))
     logger.debug('Save {0} output file'.format(outdir+profiles[k].name+'_gpsVSinsar.pdf'))
-    fig7.savefig(outdir+profiles[k].name+'_gpsVSinsar.pdf', format='PDF',dpi=150)    
+    saver.add('gpsVSinsar',fig7,outdir+profiles[k].name+'_gpsVSinsar',fmt='pdf',dpi=150)
 
-if (flat != None) and len(insardata)==2:
+if ((flat != None) or (stitch is not None)) and Mlos==2:
   logger.info('Plot fatten Maps...')
   # MAP
-  fig6=plt.figure(6,figsize = (9,7))
+  fig6=plt.figure(7,figsize = (9,7))
   ax = fig6.add_subplot(1,1,1)
   ax.axis('equal')
   if 'xmin' in locals():
     ax.set_xlim(xmin,xmax)
     ax.set_ylim(ymin,ymax)
-  for i in range(len(insardata)):
+  for i in range(Mlos):
     insar=insardata[i]
     #samp = insar.samp*4
     samp = insar.samp
 
     logger.info('Plot data in map view {0} between {1} and {2}'.format(insar.network, vmin, vmax))
-    logger.info('Subsample data every {0} point (samp option)'.format(insar.samp))
-    norm = matplotlib.colors.Normalize(vmin=insar.lmin, vmax=insar.lmax)
-    m = cm.ScalarMappable(norm = norm, cmap = 'rainbow')
-    m.set_array(insar.ulos[::samp])
-    masked_array = np.ma.array(insar.ulos[::samp], mask=np.isnan(insar.ulos[::samp]))
-    facelos = m.to_rgba(masked_array)
-    cax = ax.scatter(insar.x[::samp],insar.y[::samp],s = 2,marker = 'o',color = facelos,\
-      label = 'LOS LOS Velocities %s'%(insar.reduction),rasterized=True)
-
-    # save flatten map
+    if insar.cells is not None:
+      # regular grid: draw the flatten LOS as an image
+      gx,gy,glos = insar.image(max_scatter)
+      m = cax = draw_image(ax,gx,gy,glos,matplotlib.colors.Normalize(vmin=insar.lmin, vmax=insar.lmax),cmap='rainbow')
+    elif insar.pyramid is not None:
+      # update multi-resolution map with the flatten LOS
+      insar.build_pyramid()
+      mx,my,mlos = insar.select()
+      logger.info('Plot {0} points of the multi-resolution map (npoints option)'.format(len(mlos)))
+    else:
+      mx,my,mlos = insar.x[::samp],insar.y[::samp],insar.ulos[::samp]
+      logger.info('Subsample data every {0} point (samp option)'.format(insar.samp))
+    if insar.cells is None:
+      norm = matplotlib.colors.Normalize(vmin=insar.lmin, vmax=insar.lmax)
+      m = cm.ScalarMappable(norm = norm, cmap = 'rainbow')
+      m.set_array(mlos)
+      masked_array = np.ma.array(mlos, mask=np.isnan(mlos))
+      facelos = m.to_rgba(masked_array)
+      mx,my,facelos = decimate(max_scatter,mx,my,facelos)
+      cax = ax.scatter(mx,my,s = 2,marker = 'o',color = facelos,\
+        label = 'LOS LOS Velocities %s'%(insar.reduction),rasterized=rasterize)
+
+    # save flatten map in the units of the input file so that it can be loaded back by network
     if i==1:
-      np.savetxt('{}_flat'.format(insardata[i].network), np.vstack([insar.x,insar.y,insar.ulos]).T, fmt='%.6f')
+      if insar.utm_proj is None:
+        cols = [insar.x*1e-3, insar.y*1e-3, (insar.ulos-insar.cst)/insar.scale]
+      elif len(getattr(insar,'lon',[])) == len(insar.ulos):
+        cols = [insar.lon, insar.lat, (insar.ulos-insar.cst)/insar.scale]
+      else:
+        # tile or out-of-core networks: lon/lat are not kept in memory
+        lon,lat = insar.UTM(insar.x+insar.ref_x, insar.y+insar.ref_y, inverse=True)
+        cols = [lon, lat, (insar.ulos-insar.cst)/insar.scale]
+      if flat_fmt == 'txt':
+        flatf = outdir+'/{}_flat'.format(insardata[i].network)
+      else:
+        flatf = outdir+'/{}_flat.npy'.format(path.splitext(insardata[i].network)[0])
+      logger.info('Save flatten map in {0}'.format(flatf))
+      write_map(flatf, cols, fmt=flat_fmt)
+      del cols
 
     # plot faults
     for kk in range(Mfault):
@@ -995,10 +1367,10 @@ if (flat != None) and len(insardata)==2:
       str=(strike*math.pi)/180
       s=[math.sin(str),math.cos(str),0]
       n=[math.cos(str),-math.sin(str),0]
-      xf[0] = fmodel[kk].x+2*-150*s[0]
-      xf[1] = fmodel[kk].x+2*150*s[0]
-      yf[0] = fmodel[kk].y+2*-150*s[1]
-      yf[1] = fmodel[kk].y+2*150*s[1]
+      xf[0] = fmodel[kk].x+2*-150e3*s[0]
+      xf[1] = fmodel[kk].x+2*150e3*s[0]
+      yf[0] = fmodel[kk].y+2*-150e3*s[1]
+      yf[1] = fmodel[kk].y+2*150e3*s[1]
       # plot fault
       ax.plot(xf[:],yf[:],'--',color = 'black',lw = 1.)
     
@@ -1024,6 +1396,9 @@ if (flat != None) and len(insardata)==2:
     cbar.set_label('LOS Velocities',  labelpad=15)
     #ax.figure.colorbar(m, ax=ax, shrink = 0.5, aspect = 5)
 
+  logger.debug('Save {0} output file'.format(outdir+profiles[k].name+'-pro-flat-map.pdf'))
+  saver.add('flat',fig6,outdir+'/'+profiles[k].name+'-pro-flat-map',fmt='pdf',dpi=150)
+
 if len(profiles) > 0:
   ax1.set_xlabel('Distance (km)')
   ax1.set_ylabel('Elevation (km)')
@@ -1036,22 +1411,23 @@ if len(profiles) > 0:
     ax2.set_xlabel('Distance (km)')
     ax2.set_ylabel('LOS Velocities (mm)')
     logger.debug('Save {0} output file'.format(outdir+profiles[k].name+'pro-los.pdf'))
-    fig2.savefig(outdir+'/'+profiles[k].name+'-pro-los.pdf', format='PDF',dpi=150)
+    saver.add('los',fig2,outdir+'/'+profiles[k].name+'-pro-los',fmt='pdf',dpi=150)
   
   logger.debug('Save {0} output file'.format(outdir+profiles[k].name+'protopo.eps'))
-  fig1.savefig(outdir+'/'+profiles[k].name+'-pro-topo.pdf', format='PDF', dpi=150)
+  saver.add('topo',fig1,outdir+'/'+profiles[k].name+'-pro-topo',fmt='pdf',dpi=150)
   
   if Mgps>0:
     logger.debug('Save {0} output file'.format(outdir+profiles[k].name+'progps.eps'))
-    fig3.savefig(outdir+'/'+profiles[k].name+'-pro-gps.pdf', format='PDF',dpi=75)
+    saver.add('gps',fig3,outdir+'/'+profiles[k].name+'-pro-gps',fmt='pdf',dpi=75)
   
   if len(seismifiles)>0 : 
     logger.debug('Save {0} output file'.format(outdir+profiles[k].name+'pro-depth.eps'))
-    fig4.savefig(outdir+'/'+profiles[k].name+'-pro-depth.pdf', format='PDF', dpi=150)
+    saver.add('depth',fig4,outdir+'/'+profiles[k].name+'-pro-depth',fmt='pdf',dpi=150)
   
   logger.debug('Save {0} output file'.format(outdir+profiles[k].name+'promap.eps'))
-  fig.savefig(outdir+'/'+profiles[k].name+'-pro-map.pdf', format='PDF', dpi=150)
-
-plt.show()
+  saver.add('map',fig,outdir+'/'+profiles[k].name+'-pro-map',fmt='pdf',dpi=150)
 
+saver.save()
 
+if not headless:
+  plt.show()
@@ -0,0 +1,225 @@
+import numpy as np
+import sys
+from os import path
+
+from network2d import network, tilenetwork
+from model2d import fault2d, profile, topo, shapefile, seismicity
+from readgmt import gmt
+from tiles2d import tilecache
+from decomp2d import decomposition
+
+# classes available in the input file and class of the datasets in TOML/YAML files
+classes = {'network': network, 'tilenetwork': tilenetwork, 'profile': profile, 'topo': topo, 'fault2d': fault2d,
+    'shapefile': shapefile, 'seismicity': seismicity, 'gmt': gmt, 'tilecache': tilecache, 'decomposition': decomposition}
+datasets = {'insardata': network, 'gpsdata': network, 'profiles': profile, 'topodata': topo,
+    'fmodel': fault2d, 'shapefiles': shapefile, 'seismifiles': seismicity, 'gmtfiles': gmt,
+    'decompdata': decomposition}
+
+profile_types = [None, 'std', 'distscale', 'stdscat', 'grid', 'density']
+flat_types = [None, 'lin', 'quad', 'cub']
+ramp_locations = [None, 'positive', 'negative']
+stitch_types = [None, 'lin', 'quad']
+fault_models = [None, 'screw', 'dipslip']
+fault_fits = ['insar', 'gps']
+
+def _read_dict(fname):
+    """ Read TOML or YAML input file """
+    if fname.endswith('.toml'):
+        try:
+            import tomllib
+        except ImportError:
+            import tomli as tomllib
+        with open(fname,'rb') as f:
+            return tomllib.load(f)
+    import yaml
+    with open(fname) as f:
+        return yaml.safe_load(f)
+
+def _dataset(key,cls,kwargs):
+    # InSAR mosaics split in tiles are given as a list of files or with nworkers
+    if (key == 'insardata') and (isinstance(kwargs.get('network'),list) or 'nworkers' in kwargs):
+        return tilenetwork(**kwargs)
+    return cls(**kwargs)
+
+def _legacy_names(headless=False):
+    """
+    Names available in Python input files when they were executed in the plotPro namespace:
+    modules (np, math, os, path, sys, matplotlib, plt, cm, ...) and the public names of
+    readgmt, network2d and model2d. The non-interactive backend is selected before pyplot
+    is imported if headless.
+    """
+    import math, os, getopt, logging, warnings
+    import matplotlib
+    if headless:
+        matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    import matplotlib.cm as cm
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
+    import readgmt, network2d, model2d
+    names = {}
+    for mod in (readgmt, network2d, model2d):
+        names.update({key: value for key,value in vars(mod).items() if not key.startswith('_')})
+    names.update({'np': np, 'math': math, 'os': os, 'path': path, 'sys': sys, 'getopt': getopt,
+        'logging': logging, 'warnings': warnings, 'matplotlib': matplotlib, 'plt': plt, 'cm': cm,
+        'make_axes_locatable': make_axes_locatable, 'argv': sys.argv, 'exit': sys.exit,
+        'stdin': sys.stdin, 'stdout': sys.stdout})
+    try:
+        import scipy.optimize as opt
+        import scipy.linalg as lst
+        names.update({'opt': opt, 'lst': lst})
+    except ImportError:
+        pass
+    return names
+
+def load_config(fname,headless=False):
+    """
+    Read input file fname and return a dictionary of its variables.
+    Python input files are executed once, with the names of the plotPro namespace in which
+    they used to be executed (see _legacy_names). TOML/YAML input files define the same variables,
+    with each dataset list (insardata, gpsdata, profiles, topodata, fmodel, shapefiles,
+    seismifiles, gmtfiles) given as a list of tables of class arguments.
+    headless: select the non-interactive matplotlib backend before pyplot is imported
+    """
+    if not path.exists(fname):
+        print(f"File: {fname} not found, Exit!")
+        sys.exit()
+
+    if fname.endswith(('.toml','.yaml','.yml')):
+        config = _read_dict(fname)
+        for key,cls in datasets.items():
+            if key in config:
+                config[key] = [_dataset(key,cls,kwargs) for kwargs in config[key]]
+        return config
+
+    # allow imports of modules next to the input file
+    sys.path.append(path.dirname(path.abspath(fname)))
+    seeded = _legacy_names(headless)
+    seeded.update(classes)
+    namespace = dict(seeded)
+    namespace.update({'__file__': path.abspath(fname), '__name__': '__config__'})
+    with open(fname) as f:
+        exec(compile(f.read(), fname, 'exec'), namespace)
+    # variables of the input file only (names redefined in the input file are kept)
+    return {key: value for key,value in namespace.items() if not key.startswith('__')
+        and (key not in seeded or value is not seeded[key])}
+
+def _check_file(errors,name,fname):
+    if not path.isdir(path.dirname(fname) or '.'):
+        errors.append('{0}: directory {1} does not exist'.format(name,path.dirname(fname)))
+    elif not path.exists(fname):
+        errors.append('{0}: file {1} does not exist'.format(name,fname))
+
+def check_config(config):
+    """
+    Check input parameters before loading any data: output directory, dataset paths,
+    EPSG codes and profile parameters. Return the list of errors.
+    """
+    errors = []
+    if 'outdir' not in config:
+        errors.append('outdir is not defined')
+    if len(config.get('profiles',[])) == 0:
+        errors.append('profiles list is not defined or empty')
+    if 'xmin' in config:
+        for lim in ['xmax','ymin','ymax']:
+            if lim not in config:
+                errors.append('xmin is defined but not {0}'.format(lim))
+        if ('xmax' in config) and (config['xmin'] >= config['xmax']):
+            errors.append('xmin must be smaller than xmax')
+        if ('ymin' in config and 'ymax' in config) and (config['ymin'] >= config['ymax']):
+            errors.append('ymin must be smaller than ymax')
+    if config.get('stitch') not in stitch_types:
+        errors.append('stitch must be one of {0}'.format(stitch_types))
+    if config.get('stitch_cell',1.) <= 0:
+        errors.append('stitch_cell must be positive')
+    if (config.get('memory_budget') is not None) and (config['memory_budget'] <= 0):
+        errors.append('memory_budget must be positive')
+
+    # dataset paths
+    for insar in config.get('insardata',[]):
+        if isinstance(insar,tilenetwork):
+            if len(insar.tiles()) == 0:
+                errors.append('insardata: no tile found for {0} in {1}'.format(insar.network,insar.wdir))
+            for key in ['theta','sigcol','lookcol']:
+                if getattr(insar,key,None) not in [None,False]:
+                    errors.append('insardata {0}: {1} is not supported by tile networks'.format(insar.reduction,key))
+        else:
+            _check_file(errors,'insardata',insar.wdir + '/' + insar.network)
+        if (getattr(insar,'despike',None) is not None) and ((insar.despike <= 0) or (insar.despike_cell <= 0)):
+            errors.append('insardata {0}: despike and despike_cell must be positive'.format(insar.reduction))
+    for decomp in config.get('decompdata',[]):
+        if len(decomp.networks) < 2:
+            errors.append('decompdata {0}: at least two networks are needed'.format(decomp.reduction))
+        if decomp.cell <= 0:
+            errors.append('decompdata {0}: cell must be positive'.format(decomp.reduction))
+        if len(set(net.utm_proj for net in decomp.networks)) > 1:
+            errors.append('decompdata {0}: networks must have the same utm_proj'.format(decomp.reduction))
+        for net in decomp.networks:
+            _check_file(errors,'decompdata',net.wdir + '/' + net.network)
+            if (net.lookcol is None) and (net.proj is None):
+                errors.append('decompdata {0}: lookcol or proj must be defined for {1}'.format(decomp.reduction,net.network))
+    for gps in config.get('gpsdata',[]):
+        _check_file(errors,'gpsdata',gps.wdir + gps.network)
+        if gps.dim not in [2,3]:
+            errors.append('gpsdata {0}: dim must be 2 or 3'.format(gps.network))
+        if getattr(gps,'lookdata',None) is not None:
+            looknet = [insar for insar in config.get('insardata',[]) if insar.reduction == gps.lookdata]
+            if (len(looknet) == 0) or (looknet[0].lookcol is None):
+                errors.append('gpsdata {0}: lookdata must be the reduction of an InSAR network with lookcol'.format(gps.network))
+    for key in ['topodata','shapefiles','seismifiles','gmtfiles']:
+        for data in config.get(key,[]):
+            _check_file(errors,key,data.wdir + data.filename)
+    for seismi in config.get('seismifiles',[]):
+        if seismi.fmt not in ['csv','txt']:
+            errors.append('seismifiles {0}: fmt must be csv or txt'.format(seismi.filename))
+        if (getattr(seismi,'density',None) is not None) and (int(seismi.density) < 2):
+            errors.append('seismifiles {0}: density must be an integer larger than 1'.format(seismi.filename))
+
+    for fault in config.get('fmodel',[]):
+        if fault.model not in fault_models:
+            errors.append('fmodel {0}: model must be one of {1}'.format(fault.name,fault_models))
+        if fault.fit not in fault_fits:
+            errors.append('fmodel {0}: fit must be one of {1}'.format(fault.name,fault_fits))
+        if getattr(fault,'dipdir',1) not in [1,-1]:
+            errors.append('fmodel {0}: dipdir must be 1 or -1'.format(fault.name))
+        if (fault.model == 'dipslip') and not (0 < fault.dip <= 90):
+            errors.append('fmodel {0}: dip must be between 0 and 90 degrees'.format(fault.name))
+        if np.any(fault.depths <= 0):
+            errors.append('fmodel {0}: depths must be positive'.format(fault.name))
+
+    # EPSG codes
+    codes = set()
+    for key in datasets:
+        for data in config.get(key,[]):
+            code = data.crs if key == 'shapefiles' else getattr(data,'utm_proj',None)
+            if code is not None:
+                codes.add(code)
+    if len(codes) > 0:
+        try:
+            import pyproj
+            for code in codes:
+                try:
+                    pyproj.CRS.from_epsg(code)
+                except (pyproj.exceptions.CRSError, ValueError, TypeError):
+                    errors.append('EPSG code {0} is not valid'.format(code))
+        except ImportError:
+            errors.append('pyproj is not installed but utm_proj is defined')
+
+    # profile parameters
+    for prof in config.get('profiles',[]):
+        if (prof.l <= 0) or (prof.w <= 0):
+            errors.append('profile {0}: l and w must be positive'.format(prof.name))
+        if (prof.lbins is not None) and (prof.lbins <= 0):
+            errors.append('profile {0}: lbins must be positive'.format(prof.name))
+        if (prof.npbin is not None) and (prof.npbin <= 10):
+            errors.append('profile {0}: npbin must be larger than 10'.format(prof.name))
+        if (prof.maxbin is not None) and (prof.maxbin <= 0):
+            errors.append('profile {0}: maxbin must be positive'.format(prof.name))
+        if prof.wbins <= 0:
+            errors.append('profile {0}: wbins must be positive'.format(prof.name))
+        if prof.typ not in profile_types:
+            errors.append('profile {0}: type must be one of {1}'.format(prof.name,profile_types))
+        if prof.flat not in flat_types:
+            errors.append('profile {0}: flat must be one of {1}'.format(prof.name,flat_types))
+        if prof.loc_ramp not in ramp_locations:
+            errors.append('profile {0}: loc_ramp must be one of {1}'.format(prof.name,ramp_locations))
+    return errors
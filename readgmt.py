@@ -15,6 +15,10 @@ class gmt:
 
         self.xp=[]
         self.yp=[]
+
+        # segments within map
+        self.fx=[]
+        self.fy=[]
     
         # projection
         self.utm_proj=utm_proj
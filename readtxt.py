@@ -0,0 +1,116 @@
+import numpy as np
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# files smaller than this are parsed in a single chunk
+min_chunk = 32*2**20
+
+def _loadtxt(fname,usecols,dtypes,comments):
+    """ np.loadtxt fallback returning one array per column """
+    if len(set(dtypes)) == 1:
+        cols = np.loadtxt(fname,comments=comments,unpack=True,usecols=usecols,dtype=dtypes[0])
+        return [col for col in cols]
+    dtype = np.dtype([('f{}'.format(i),dt) for i,dt in enumerate(dtypes)])
+    return list(np.loadtxt(fname,comments=comments,unpack=True,usecols=usecols,dtype=dtype))
+
+def _chunks(fname,nchunk):
+    """ Split file in nchunk byte ranges ending on a new line """
+    size = os.path.getsize(fname)
+    bounds = [0]
+    with open(fname,'rb') as f:
+        for i in range(1,nchunk):
+            f.seek(max(size*i//nchunk,bounds[-1]))
+            f.readline()
+            bounds.append(f.tell())
+    bounds.append(size)
+    return [(bounds[i],bounds[i+1]) for i in range(nchunk) if bounds[i+1] > bounds[i]]
+
+def _parse(fname,start,end,usecols,strcols,comments):
+    import io
+    import pandas
+    with open(fname,'rb') as f:
+        f.seek(start)
+        data = f.read(end-start)
+    try:
+        df = pandas.read_csv(io.BytesIO(data),sep=r'\s+',header=None,comment=comments,
+            usecols=list(usecols),dtype={col: str for col in strcols},engine='c')
+    except pandas.errors.EmptyDataError:
+        return None
+    return [df[col].to_numpy() for col in usecols]
+
+def loadcols(fname,usecols,dtype=np.float32,comments='#',nthreads=None):
+    """
+    Read columns usecols of a whitespace separated text file. Return the same arrays as
+    np.loadtxt(fname,comments=comments,unpack=True,usecols=usecols,dtype=dtype).
+    The file is split in chunks parsed concurrently by the pandas C parser, which releases
+    the GIL, with a fall back to np.loadtxt if pandas is not installed.
+    usecols: column indices
+    dtype: dtype of all columns or list of dtypes, one per column (e.g. 'S4' for station names)
+    nthreads: number of parser threads (Default: number of CPUs, maximum 8)
+    """
+    if isinstance(dtype,(list,tuple)):
+        dtypes = [np.dtype(dt) for dt in dtype]
+    else:
+        dtypes = [np.dtype(dtype)]*len(usecols)
+
+    try:
+        import pandas
+    except ImportError:
+        return _loadtxt(fname,usecols,dtypes,comments)
+
+    if nthreads is None:
+        nthreads = min(os.cpu_count() or 1,8)
+    # keep station names as strings (e.g. leading zeros)
+    strcols = [col for col,dt in zip(usecols,dtypes) if dt.kind == 'S']
+    nchunk = int(max(1,min(nthreads,os.path.getsize(fname)//min_chunk)))
+    chunks = _chunks(fname,nchunk)
+    if len(chunks) > 1:
+        with ThreadPoolExecutor(max_workers=nthreads) as pool:
+            parts = list(pool.map(lambda c: _parse(fname,c[0],c[1],usecols,strcols,comments),chunks))
+    else:
+        parts = [_parse(fname,c[0],c[1],usecols,strcols,comments) for c in chunks]
+    parts = [part for part in parts if part is not None]
+
+    cols = []
+    for j,dt in enumerate(dtypes):
+        if len(parts) > 0:
+            col = np.concatenate([part[j] for part in parts])
+        else:
+            col = np.array([])
+        if dt.kind == 'S':
+            # station names: same truncation as np.loadtxt
+            col = np.array([str(v).encode('latin1')[:dt.itemsize] for v in col],dtype=dt)
+        else:
+            col = col.astype(dt)
+        cols.append(col)
+    return cols
+
+def itercols(fname,usecols,dtype=np.float32,comments='#',chunksize=1000000):
+    """
+    Iterate over chunks of chunksize rows of columns usecols of a whitespace separated
+    text file or of a binary .npy file, with bounded memory
+    """
+    if fname.endswith('.npy'):
+        data = np.load(fname,mmap_mode='r')
+        for i in range(0,data.shape[0],chunksize):
+            yield [np.array(data[i:i+chunksize,col],dtype=dtype) for col in usecols]
+        return
+
+    try:
+        import pandas
+    except ImportError:
+        pandas = None
+    if pandas is not None:
+        reader = pandas.read_csv(fname,sep=r'\s+',header=None,comment=comments,
+            usecols=list(usecols),engine='c',chunksize=chunksize)
+        for df in reader:
+            yield [df[col].to_numpy().astype(dtype) for col in usecols]
+    else:
+        import itertools
+        with open(fname) as f:
+            while True:
+                lines = list(itertools.islice(f,chunksize))
+                if len(lines) == 0:
+                    break
+                cols = np.loadtxt(lines,comments=comments,usecols=usecols,dtype=dtype,ndmin=2)
+                yield [cols[:,j] for j in range(len(usecols))]
@@ -0,0 +1,104 @@
+import numpy as np
+
+class profresult:
+    """
+    profresult class: results of an InSAR network along one profile. Swath points are
+    stored once and the points used in the bins are kept as indices.
+    Attributes:
+    index: indices of the network points within the swath (None if the swath points
+    are not the network points, e.g. quick-look or tile profiles)
+    xpp, ypp: across and along profile distances of the swath points
+    los, sig: LOS and uncertainties of the swath points (sig is None without sigcol)
+    bins: edges of the bins along profile
+    distance, width, moy_los, std_los, err_los: centres, widths, medians, standard deviations and standard errors of the bins
+    used: indices of the swath points within the bins after cleaning, in bin order
+    count, mean_los, std_all: exact number of points, mean and standard deviation of all the points
+    of the bins (out-of-core profiles, empty otherwise)
+    grid: swathgrid of the grid profiles (Optional)
+    ramp: parameters of the ramp removed along profile (Optional)
+    """
+
+    __slots__ = ('index','xpp','ypp','los','sig','bins','distance','width','moy_los','std_los','err_los','used','count','mean_los','std_all','grid','ramp')
+
+    def __init__(self,index,xpp,ypp,los,sig=None):
+        self.index=index
+        self.xpp=xpp
+        self.ypp=ypp
+        self.los=los
+        self.sig=sig
+        self.bins=np.array([])
+        # Initialise for plot in case no data for this profile
+        self.distance=np.array([])
+        self.width=np.array([])
+        self.moy_los=np.array([])
+        self.std_los=np.array([])
+        self.err_los=np.array([])
+        self.used=np.array([],dtype=int)
+        self.count=np.array([])
+        self.mean_los=np.array([])
+        self.std_all=np.array([])
+        self.grid=None
+        self.ramp=None
+
+    @property
+    def xperp(self):
+        return self.xpp[self.used]
+
+    @property
+    def yperp(self):
+        return self.ypp[self.used]
+
+    @property
+    def uulos(self):
+        return self.los[self.used]
+
+class gpsresult:
+    """
+    gpsresult class: results of a GNSS network along one profile
+    Attributes:
+    data: GNSS network
+    index: indices of the stations within the swath
+    xpp, ypp: across and along profile distances of the stations
+    upar, uperp, sigmapar, sigmaperp: fault-parallel and perpendicular velocities and uncertainties
+    uv, sigmav, los, slos: vertical and LOS velocities and uncertainties of the stations (3D networks)
+    """
+
+    __slots__ = ('data','index','xpp','ypp','upar','uperp','sigmapar','sigmaperp')
+
+    def __init__(self,data,index,xpp,ypp,strike):
+        self.data=data
+        self.index=index
+        self.xpp=xpp
+        self.ypp=ypp
+        # fault parallel and perpendicular velocities: strike in radians
+        ux, uy = data.ux[index], data.uy[index]
+        sx, sy = data.sigmax[index], data.sigmay[index]
+        self.upar = ux*np.sin(strike) + uy*np.cos(strike)
+        self.uperp = ux*np.cos(strike) - uy*np.sin(strike)
+        self.sigmaperp = ((sx*np.cos(strike))**2 + (sy*np.sin(strike))**2)**0.5
+        self.sigmapar = ((sx*np.sin(strike))**2 + (sy*np.cos(strike))**2)**0.5
+
+    @property
+    def uv(self):
+        return self.data.uv[self.index]
+
+    @property
+    def sigmav(self):
+        return self.data.sigmav[self.index]
+
+    @property
+    def los(self):
+        return self.data.ulos[self.index]
+
+    @property
+    def slos(self):
+        return self.data.sigmalos[self.index]
+
+class profresults(dict):
+    """
+    profresults class: profile results of all datasets keyed by (dataset reduction, profile name)
+    """
+
+    def dataset(self,reduction,profiles):
+        """ Results of dataset reduction along profiles, None for missing profiles """
+        return [self.get((reduction,prof.name)) for prof in profiles]
@@ -0,0 +1,123 @@
+import numpy as np
+import math
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger('plotPro.log')
+
+# figures to save, shared with the forked workers
+_jobs = []
+
+def decimate(maxn,*arrays):
+    """
+    Decimate arrays to at most maxn points for scatter layers.
+    Return the arrays unchanged if maxn is None.
+    """
+    if (maxn is None) or (len(arrays[0]) <= maxn):
+        return arrays if len(arrays) > 1 else arrays[0]
+    step = int(math.ceil(len(arrays[0])/float(maxn)))
+    arrays = tuple(np.asarray(a)[::step] for a in arrays)
+    return arrays if len(arrays) > 1 else arrays[0]
+
+def draw_image(ax,x,y,z,norm,cmap=None,aspect=None,**kwargs):
+    """
+    Draw the 2D array z with cell centres x,y in axis ax: image if x,y are 1D (regular grid),
+    quadrilateral mesh if x,y are 2D. The aspect of ax is kept (e.g. equal for maps) if aspect
+    is None. Return the mappable for colorbars.
+    """
+    if aspect is None:
+        aspect = ax.get_aspect()
+    z = np.ma.array(z,mask=np.isnan(z))
+    if np.ndim(x) == 1:
+        dx = x[1] - x[0] if len(x) > 1 else 1.
+        dy = y[1] - y[0] if len(y) > 1 else 1.
+        return ax.imshow(z,extent=(x[0]-dx/2.,x[-1]+dx/2.,y[0]-dy/2.,y[-1]+dy/2.),origin='lower',aspect=aspect,
+            norm=norm,cmap=cmap,interpolation='nearest',**kwargs)
+    return ax.pcolormesh(x,y,z,norm=norm,cmap=cmap,shading='nearest',rasterized=True,**kwargs)
+
+def density(x,y,extent,shape):
+    """
+    2D histogram of points x,y on shape (ny,nx) pixels within extent (xmin,xmax,ymin,ymax),
+    computed with one bincount
+    """
+    ny, nx = shape
+    ok = ~np.isnan(x) & ~np.isnan(y)
+    ix = np.floor((x[ok]-extent[0])/(extent[1]-extent[0])*nx).astype(np.int64)
+    iy = np.floor((y[ok]-extent[2])/(extent[3]-extent[2])*ny).astype(np.int64)
+    ok = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+    return np.bincount(iy[ok]*nx + ix[ok],minlength=nx*ny).reshape(ny,nx)
+
+def draw_density(ax,x,y,extent,color,shape=(200,400),aspect=None,**kwargs):
+    """
+    Draw the density of points x,y in axis ax as a log-scaled image from transparent to color,
+    so that several networks can be overlaid. The aspect of ax is kept (e.g. equal for maps and
+    depth sections) if aspect is None. Return the image (None if no point within extent).
+    """
+    if aspect is None:
+        aspect = ax.get_aspect()
+    from matplotlib.colors import LinearSegmentedColormap, LogNorm, to_rgba
+    h = np.ma.masked_equal(density(np.asarray(x),np.asarray(y),extent,shape),0)
+    if h.count() == 0:
+        return None
+    cmap = LinearSegmentedColormap.from_list('density',[to_rgba(color,0.1),to_rgba(color,1.)])
+    return ax.imshow(h,extent=extent,origin='lower',aspect=aspect,cmap=cmap,norm=LogNorm(vmin=1,vmax=max(h.max(),2)),
+        interpolation='nearest',**kwargs)
+
+class figsaver:
+    """
+    figsaver class: collect figures and save them at the end of the run
+    Parameters:
+    fmt, dpi: default output format (pdf, png, webp, eps...) and resolution of all figures.
+    If None, use the format and resolution given for each figure.
+    options: dictionary of per-figure options, e.g. {'map': {'format': 'png', 'dpi': 300}}
+    with figure names: map, los, topo, gps, depth, gpsVSinsar, histo, flat, grid
+    nworkers: number of worker processes rendering the figures (Default: 1)
+    """
+
+    def __init__(self,fmt=None,dpi=None,options=None,nworkers=1):
+        self.fmt=fmt
+        self.dpi=dpi
+        if options is None:
+            options = {}
+        self.options=options
+        self.nworkers=nworkers
+
+    def add(self,name,fig,basename,fmt='pdf',dpi=150):
+        """ Add figure name to save in basename.<format> """
+        if self.fmt is not None:
+            fmt = self.fmt
+        if self.dpi is not None:
+            dpi = self.dpi
+        opts = self.options.get(name,{})
+        fmt, dpi = opts.get('format',fmt).lower(), opts.get('dpi',dpi)
+        fname = '{}.{}'.format(basename,fmt)
+        # replace previous figure with the same output file
+        for i in range(len(_jobs)):
+            if _jobs[i][1] == fname:
+                _jobs[i] = (fig,fname,fmt,dpi)
+                return fname
+        _jobs.append((fig,fname,fmt,dpi))
+        return fname
+
+    def save(self):
+        """ Render and save all figures """
+        nworkers = min(self.nworkers,len(_jobs))
+        if nworkers > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            # forked workers share the figures with the main process: nothing is pickled
+            logger.info('Save {0} figures with {1} workers'.format(len(_jobs),nworkers))
+            with ProcessPoolExecutor(max_workers=nworkers,mp_context=multiprocessing.get_context('fork')) as pool:
+                for fname,dt in pool.map(_save,range(len(_jobs))):
+                    logger.info('Saved {0} in {1:.1f} s'.format(fname,dt))
+        else:
+            for i in range(len(_jobs)):
+                fname,dt = _save(i)
+                logger.info('Saved {0} in {1:.1f} s'.format(fname,dt))
+        del _jobs[:]
+
+def _save(i):
+    t0 = time.time()
+    fig,fname,fmt,dpi = _jobs[i]
+    fig.savefig(fname,format=fmt,dpi=dpi)
+    return fname, time.time() - t0
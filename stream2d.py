@@ -0,0 +1,84 @@
+import numpy as np
+
+class binstats:
+    """
+    binstats class: running statistics of values within the bins of a profile.
+    Counts, means and variances are exact. Quantiles are estimated from a
+    per-bin histogram with fixed edges. All statistics can be merged exactly
+    between chunks or workers, with a memory independent of the number of values.
+    Parameters:
+    centres: centres of the bins along profile
+    edges: edges of the histogram of values (same for all merged binstats)
+    """
+
+    def __init__(self,centres,edges):
+        self.centres=np.asarray(centres)
+        self.edges=np.asarray(edges,dtype=np.float64)
+        nbins, nbuck = len(self.centres), len(self.edges)-1
+        self.count=np.zeros(nbins)
+        self.mean=np.zeros(nbins)
+        self.m2=np.zeros(nbins)
+        self.hist=np.zeros((nbins,nbuck))
+        # number of values outside the edges, counted in the end buckets
+        self.outside=0
+
+    def _merge(self,count,mean,m2):
+        # parallel algorithm of Chan et al. for means and variances
+        total = self.count + count
+        ok = total > 0
+        delta = mean - self.mean
+        self.mean[ok] = self.mean[ok] + delta[ok]*count[ok]/total[ok]
+        self.m2[ok] = self.m2[ok] + m2[ok] + delta[ok]**2*self.count[ok]*count[ok]/total[ok]
+        self.count = total
+
+    def update(self,inds,values):
+        """ Add values in bins inds (values outside bins or NaN are ignored) """
+        nbins, nbuck = self.hist.shape
+        ok = (inds >= 0) & (inds < nbins) & ~np.isnan(values)
+        inds, values = inds[ok], values[ok].astype(np.float64)
+        count = np.bincount(inds,minlength=nbins).astype(np.float64)
+        mean = np.bincount(inds,weights=values,minlength=nbins)/np.maximum(count,1)
+        m2 = np.bincount(inds,weights=(values-mean[inds])**2,minlength=nbins)
+        self._merge(count,mean,m2)
+
+        self.outside += np.count_nonzero((values < self.edges[0]) | (values > self.edges[-1]))
+        b = np.clip(np.searchsorted(self.edges,values,side='right')-1,0,nbuck-1)
+        self.hist += np.bincount(inds*nbuck+b,minlength=nbins*nbuck).reshape(nbins,nbuck)
+
+    def merge(self,other):
+        """ Merge statistics of other binstats with the same bins and edges """
+        self._merge(other.count,other.mean,other.m2)
+        self.hist += other.hist
+        self.outside += other.outside
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2/np.maximum(self.count,1))
+
+    def quantile(self,q):
+        """ Percentile q of the values within each bin """
+        nbins, nbuck = self.hist.shape
+        rows = np.arange(nbins)
+        cum = np.cumsum(self.hist,axis=1)
+        target = q/100.*cum[:,-1]
+        idx = np.minimum(np.sum(cum < target[:,None],axis=1),nbuck-1)
+        h = self.hist[rows,idx]
+        prev = cum[rows,idx] - h
+        frac = np.where(h > 0,(target-prev)/np.maximum(h,1),0.5)
+        width = np.diff(self.edges)
+        return self.edges[idx] + frac*width[idx]
+
+    def clipped(self,perc):
+        """
+        Median and standard deviation of the values within each bin
+        between percentiles 100-perc and perc
+        """
+        lo, hi = self.quantile(100-perc), self.quantile(perc)
+        e0, e1 = self.edges[:-1], self.edges[1:]
+        overlap = np.clip(np.minimum(e1,hi[:,None]) - np.maximum(e0,lo[:,None]),0,None)/(e1-e0)
+        w = self.hist*overlap
+        wsum = np.maximum(np.sum(w,axis=1),1e-12)
+        c = 0.5*(e0+e1)
+        m = np.sum(w*c,axis=1)/wsum
+        var = np.sum(w*(c-m[:,None])**2,axis=1)/wsum
+        return self.quantile(50), np.sqrt(var)
@@ -0,0 +1,65 @@
+import numpy as np
+
+def frame(profiles):
+    """
+    Geometry of all profiles as arrays. Return the matrix M of shape (3, 2*nprofiles)
+    such that [x, y, 1] @ M gives the along profile (ypp) coordinates of the points
+    in the first nprofiles columns and the across profile (xpp) coordinates in the last ones,
+    and the half lengths and half widths of the profiles.
+    """
+    nprof = len(profiles)
+    M = np.zeros((3,2*nprof))
+    for k,prof in enumerate(profiles):
+        M[:,k] = prof.n[0], prof.n[1], -(prof.x*prof.n[0] + prof.y*prof.n[1])
+        M[:,nprof+k] = prof.s[0], prof.s[1], -(prof.x*prof.s[0] + prof.y*prof.s[1])
+    hl = np.array([prof.l/2. for prof in profiles])
+    hw = np.array([prof.w/2. for prof in profiles])
+    return M, hl, hw
+
+def _rotate(M,x,y):
+    P = np.empty((len(x),3))
+    P[:,0], P[:,1], P[:,2] = x, y, 1.
+    return np.dot(P,M)
+
+def rotate(profiles,x,y):
+    """
+    Along (ypp) and across (xpp) profile coordinates of points x,y in all profiles.
+    Return two arrays of shape (nprofiles, npoints): use swaths for large datasets.
+    """
+    M,hl,hw = frame(profiles)
+    P = _rotate(M,np.atleast_1d(x),np.atleast_1d(y))
+    nprof = len(profiles)
+    return P[:,:nprof].T, P[:,nprof:].T
+
+def swaths(profiles,x,y,chunk=2**18):
+    """
+    Select the points x,y within the swath of each profile. Points are rotated by blocks of
+    chunk points with one matrix product for all profiles, so that each block is read once
+    and the memory used is bounded by chunk*(3+2*nprofiles) floats.
+    Return for each profile (index, xpp, ypp): indices of the points within the swath and their
+    across and along profile coordinates. Points with NaN coordinates are kept as in the profiles.
+    """
+    return inswath(frame(profiles),x,y,chunk)
+
+def inswath(geom,x,y,chunk=2**18):
+    """ Same as swaths with the profile geometry geom=frame(profiles) (e.g. sent to workers) """
+    M,hl,hw = geom
+    nprof = len(hl)
+    parts = [([],[],[]) for k in range(nprof)]
+    for i in range(0,len(x),chunk):
+        P = _rotate(M,x[i:i+chunk],y[i:i+chunk])
+        ypp, xpp = P[:,:nprof], P[:,nprof:]
+        outside = (xpp > hw) | (xpp < -hw) | (ypp > hl) | (ypp < -hl)
+        for k in range(nprof):
+            j = np.flatnonzero(~outside[:,k])
+            parts[k][0].append(i + j)
+            parts[k][1].append(xpp[j,k])
+            parts[k][2].append(ypp[j,k])
+
+    out = []
+    for index,xpp,ypp in parts:
+        if len(index) == 0:
+            out.append((np.array([],dtype=int), np.array([]), np.array([])))
+        else:
+            out.append((np.concatenate(index), np.concatenate(xpp), np.concatenate(ypp)))
+    return out
@@ -0,0 +1,144 @@
+import numpy as np
+import math
+import io
+import os
+from os import path
+
+# Esri tiles used by default by plot_basemap
+esri_shaded = 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Shaded_Relief/MapServer/tile/{z}/{y}/{x}'
+esri_topo = 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Topo_Map/MapServer/tile/{z}/{y}/{x}'
+
+def _decode(data):
+    """ Decode png or jpeg tile in a float RGBA array """
+    from PIL import Image
+    img = Image.open(io.BytesIO(data)).convert('RGBA')
+    return np.asarray(img,dtype=np.float32)/255.
+
+class tilecache:
+    """
+    tilecache class: local provider of basemap tiles for plot_basemap
+    Parameters:
+    source: XYZ tile directory ({z}/{x}/{y}.png or .jpg) or MBTiles file (.mbtiles)
+    url: tile URL template used to fill missing tiles of an XYZ directory when online,
+    e.g. tiles2d.esri_shaded (Default: None, offline)
+    maxzoom: maximum zoom level (Default: 16)
+    npix: number of pixels along the width of the basemap image (Default: 1024)
+    """
+
+    def __init__(self,source,url=None,maxzoom=16,npix=1024):
+        self.source=source
+        self.url=url
+        self.maxzoom=maxzoom
+        self.npix=npix
+        self.mbtiles=source.endswith('.mbtiles')
+        # decoded tiles shared by all maps of the run
+        self.tiles={}
+        # MBTiles connection opened at the first read
+        self.db=None
+
+    def _read(self,z,x,y):
+        if self.mbtiles:
+            if self.db is None:
+                import sqlite3
+                self.db = sqlite3.connect(self.source)
+            row = self.db.execute('SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?',
+                (z,x,2**z-1-y)).fetchone()
+            return None if row is None else bytes(row[0])
+        for ext in ['png','jpg','jpeg']:
+            fname = path.join(self.source,str(z),str(x),'{}.{}'.format(y,ext))
+            if path.exists(fname):
+                with open(fname,'rb') as f:
+                    return f.read()
+        if self.url is not None:
+            return self._fetch(z,x,y)
+        return None
+
+    def _fetch(self,z,x,y):
+        """ Download missing tile and save it in the XYZ directory """
+        from urllib.request import urlopen
+        try:
+            data = urlopen(self.url.format(z=z,x=x,y=y),timeout=30).read()
+        except Exception as e:
+            print('Cannot download tile {}/{}/{}: {}'.format(z,x,y,e))
+            return None
+        fdir = path.join(self.source,str(z),str(x))
+        os.makedirs(fdir,exist_ok=True)
+        with open(path.join(fdir,'{}.png'.format(y)),'wb') as f:
+            f.write(data)
+        return data
+
+    def close(self):
+        """ Close the MBTiles connection. Decoded tiles are kept """
+        if self.db is not None:
+            self.db.close()
+            self.db=None
+
+    def tile(self,z,x,y):
+        """ Return tile z/x/y as a 256x256 RGBA array or None if not available """
+        key = (z,x,y)
+        if key not in self.tiles:
+            data = self._read(z,x,y)
+            self.tiles[key] = None if data is None else _decode(data)
+        return self.tiles[key]
+
+    def prefetch(self,lonmin,lonmax,latmin,latmax,zooms):
+        """ Fill the XYZ directory with all tiles of the extent for the zoom levels zooms """
+        for z in zooms:
+            x0,y0 = _tilexy(lonmin,latmax,z)
+            x1,y1 = _tilexy(lonmax,latmin,z)
+            for x in range(int(x0),int(x1)+1):
+                for y in range(int(y0),int(y1)+1):
+                    self._read(z,x,y)
+
+    def zoom(self,lon,nx):
+        """ Zoom level giving about nx pixels over the longitude range of lon """
+        dlon = max(np.nanmax(lon) - np.nanmin(lon),1e-6)
+        z = int(math.ceil(math.log(nx*360./(256.*dlon),2)))
+        return min(max(z,0),self.maxzoom)
+
+    def add_basemap(self,ax,crs,alpha=1,zorder=0):
+        """
+        Draw the basemap in axis ax with coordinates in EPSG crs.
+        The zoom level is chosen from the map extent.
+        """
+        import pyproj
+        xmin,xmax = ax.get_xlim()
+        ymin,ymax = ax.get_ylim()
+        nx = self.npix
+        ny = max(int(nx*(ymax-ymin)/(xmax-xmin)),1)
+        xx,yy = np.meshgrid(np.linspace(xmin,xmax,nx),np.linspace(ymax,ymin,ny))
+        transformer = pyproj.Transformer.from_crs("EPSG:{}".format(crs),"EPSG:4326",always_xy=True)
+        lon,lat = transformer.transform(xx,yy)
+        z = self.zoom(lon,nx)
+
+        # position of each pixel in the tile mosaic
+        tx,ty = _tilexy(lon,lat,z)
+        tx0,ty0 = int(np.floor(np.nanmin(tx))),int(np.floor(np.nanmin(ty)))
+        tx1,ty1 = int(np.floor(np.nanmax(tx))),int(np.floor(np.nanmax(ty)))
+        mosaic = np.ones(((ty1-ty0+1)*256,(tx1-tx0+1)*256,4),dtype=np.float32)
+        mosaic[:,:,3] = 0
+        missing = 0
+        for x in range(tx0,tx1+1):
+            for y in range(ty0,ty1+1):
+                img = self.tile(z,x % 2**z,y)
+                if img is None:
+                    missing += 1
+                    continue
+                mosaic[(y-ty0)*256:(y-ty0)*256+img.shape[0],(x-tx0)*256:(x-tx0)*256+img.shape[1]] = img[:256,:256]
+        if missing > 0:
+            print('{} tiles at zoom {} not found in {}'.format(missing,z,self.source))
+
+        px = np.clip(((tx-tx0)*256).astype(int),0,mosaic.shape[1]-1)
+        py = np.clip(((ty-ty0)*256).astype(int),0,mosaic.shape[0]-1)
+        ax.imshow(mosaic[py,px],extent=(xmin,xmax,ymin,ymax),origin='upper',alpha=alpha,
+            zorder=zorder,interpolation='bilinear')
+        ax.set_xlim(xmin,xmax)
+        ax.set_ylim(ymin,ymax)
+
+def _tilexy(lon,lat,z):
+    """ Fractional web mercator tile indices of lon,lat at zoom z """
+    n = 2.**z
+    lat = np.clip(np.deg2rad(lat),-1.4844,1.4844)
+    tx = (np.asarray(lon)+180.)/360.*n
+    ty = (1. - np.arcsinh(np.tan(lat))/np.pi)/2.*n
+    return tx,ty